@@ -0,0 +1,84 @@
+import numpy as np
+import shapely
+
+
+def group_sum(codes, values, n):
+    """
+    Sums values per group, where groups are integer codes in range(n).
+    Missing values count as 0, like pandas. Sorted codes, such as the source
+    positions of intersection pieces, are summed in one np.add.reduceat over
+    their runs, other codes with np.bincount.
+    Parameters
+    ----------
+    codes : ndarray
+        Group code of every row.
+    values : ndarray
+        Values to sum, 1-D or 2-D with one row per code.
+    n : int
+        Number of groups.
+    Returns
+    -------
+    totals : ndarray
+        Total per group, with one row per group for 2-D values.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    values = np.where(np.isnan(values), 0, values)
+    if values.ndim == 1:
+        return np.bincount(codes, values, n)
+
+    totals = np.zeros((n, values.shape[1]))
+    if len(codes) and np.all(codes[1:] >= codes[:-1]):
+        starts, ends = group_runs(codes)
+        totals[codes[starts]] = np.add.reduceat(values, starts, axis=0)
+    else:
+        for col in range(values.shape[1]):
+            totals[:, col] = np.bincount(codes, values[:, col], n)
+    return totals
+
+
+def group_share(codes, values, n):
+    """
+    Divides every value by the total of its group, broadcasting the group
+    totals back to the rows by fancy indexing.
+    """
+    totals = group_sum(codes, values, n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.asarray(values, dtype=float) / totals[codes]
+
+
+def group_runs(codes):
+    """
+    Returns the start and end row of every run of equal sorted codes.
+    """
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(first)
+    return starts, np.append(starts[1:], len(codes))
+
+
+def group_first(codes):
+    """
+    Returns the position of the first row of every group, in code order.
+    """
+    return np.unique(codes, return_index=True)[1]
+
+
+def group_union(codes, geoms):
+    """
+    Unions the geometries of every run of equal sorted codes.
+    Parameters
+    ----------
+    codes : ndarray
+        Sorted group code of every geometry.
+    geoms : ndarray
+        Shapely geometries.
+    Returns
+    -------
+    unions : ndarray
+        One geometry per run, in code order.
+    """
+    starts, ends = group_runs(codes)
+    unions = np.empty(len(starts), dtype=object)
+    unions[:] = [shapely.union_all(geoms[start:end]) for start, end in zip(starts, ends)]
+    return unions
@@ -0,0 +1,558 @@
+import copy
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from modules.aggregate import group_first, group_union
+
+
+class IntersectionIndex:
+    """
+    Pairwise intersection pieces between a source and a target layer.
+
+    The overlay is run once and stored as the positional source id, target id
+    and area of every piece, so the interpolation methods can reuse it with a
+    different suffix, column list or class dictionary without intersecting
+    the geometries again.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    target : GeoDataFrame
+        Target polygons.
+    keep_geometry : bool, optional
+        Keep the geometry of every piece. Methods that return the intersected
+        polygons need it. Without it only the area of every piece is kept.
+        Either way, pairs where one polygon lies inside the other, such as
+        blocks inside tracts, are not clipped: the piece is the inner
+        polygon. The default is True.
+    assign : str, optional
+        How target polygons are matched to source polygons.
+        'intersection' clips every pair of polygons that overlap.
+        'point' assigns each target polygon whole to the source polygon that
+        holds its representative point, which suits small targets such as
+        parcels. 'point_exact' does the same but clips the target polygons
+        that cross the edge of their source polygon. 'key' assigns each
+        target polygon whole to the source polygon with the same key, see
+        keys. The default is 'intersection'.
+    tile_size : float, optional
+        Build the pieces tile by tile on a grid of square tiles of this size,
+        in layer units. Each source polygon belongs to the tile holding the
+        center of its bounding box, so every pair is built once and memory
+        used by the overlay is bounded by the tile. The default is None,
+        which builds all pieces at once.
+    workers : int, optional
+        Build the pieces in this many processes. Source polygons are split
+        into tiles when tile_size is given, otherwise into runs along a
+        Hilbert curve through their bounding boxes, and the pieces of every
+        part are merged in the same order as a serial build. The default is
+        None, which builds in this process.
+    keys : tuple, optional
+        (source_col, target_col) or (source_col, target_col, prefix) for
+        assign='key'. A target polygon belongs to the source polygon whose
+        source_col equals its target_col, or the first prefix characters of
+        it, e.g. 12 to match block GEOIDs to block groups. Suits layers that
+        nest exactly, where overlay only adds slivers. The default is None.
+
+    Attributes
+    ----------
+    source_pos : ndarray
+        Position in source of the polygon each piece comes from.
+    target_pos : ndarray
+        Position in target of the polygon each piece comes from.
+    area : ndarray
+        Area of each piece.
+    geometry : GeoSeries
+        Geometry of each piece, None if keep_geometry is False.
+    source_area : ndarray
+        Area of every source polygon.
+    target_area : ndarray
+        Area of every target polygon.
+    """
+
+    def __init__(self, source, target, keep_geometry = True, assign = 'intersection',
+                 tile_size = None, workers = None, keys = None):
+        self._set_layers(source, target)
+        self.assign = assign
+        if assign == 'key':
+            if keys is None:
+                raise ValueError("assign='key' needs keys")
+            source_pos, target_pos, area, geometry = _key_pieces(source, target, keys)
+            self._set_pieces(source_pos, target_pos, area, geometry if keep_geometry else None)
+            return
+        if assign == 'intersection' and keep_geometry:
+            build = _overlay_pieces
+        elif assign == 'intersection':
+            build = _area_pieces
+        elif assign in ('point', 'point_exact'):
+            build = functools.partial(_point_pieces, exact = assign == 'point_exact')
+        else:
+            raise ValueError("assign must be 'intersection', 'point', 'point_exact' or 'key'")
+
+        if tile_size:
+            parts = _tiles(source.geometry, tile_size)
+        elif workers and workers > 1:
+            parts = _curve_runs(source.geometry, workers * 4)
+        else:
+            parts = None
+
+        if parts is None:
+            pieces = build(source.geometry, target.geometry)
+        else:
+            pieces = _partitioned_pieces(source.geometry, target.geometry, build, parts,
+                                         keep_geometry, workers)
+            if assign == 'point':
+                #a point on the edge between parts can be matched in both, keep the first
+                pieces = _first_per_target(*pieces)
+        source_pos, target_pos, area, geometry = pieces
+        self._set_pieces(source_pos, target_pos, area, geometry if keep_geometry else None)
+
+    def _set_layers(self, source, target):
+        self.source_index = source.index.copy()
+        self.target_index = target.index.copy()
+        self.source_area = np.asarray(source.geometry.area, dtype=float)
+        self.target_area = np.asarray(target.geometry.area, dtype=float)
+        self.crs = source.crs
+
+    def _set_pieces(self, source_pos, target_pos, area, geometry):
+        self.source_pos = np.asarray(source_pos, dtype=np.int64)
+        self.target_pos = np.asarray(target_pos, dtype=np.int64)
+        self.area = np.asarray(area, dtype=float)
+        if geometry is not None:
+            geometry = gpd.GeoSeries(geometry, crs=self.crs).reset_index(drop=True)
+        self.geometry = geometry
+
+    def save(self, path, source, target, compression = 'zstd'):
+        """
+        Writes the pieces to a parquet file as source id, target id, piece
+        area and areal weight, tagged with fingerprints of the source and
+        target geometries so the file is only reused for the same layers.
+        Ids are positions in source and target.
+
+        Parameters
+        ----------
+        path : str
+            Parquet file to write.
+        source : GeoDataFrame
+            Source polygons the index was built from.
+        target : GeoDataFrame
+            Target polygons the index was built from.
+        compression : str, optional
+            Parquet compression codec. The default is 'zstd'.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.check(source, target)
+        table = pd.DataFrame({
+            'source_id': self.source_pos,
+            'target_id': self.target_pos,
+            'intersect_area': self.area,
+            'areal_wt': self.area / self.source_area[self.source_pos],
+        })
+        if self.geometry is not None:
+            table['geometry'] = self.geometry.to_wkb().to_numpy()
+        meta = {
+            'source_fingerprint': geometry_fingerprint(source),
+            'target_fingerprint': geometry_fingerprint(target),
+            'geometry': self.geometry is not None,
+            'assign': self.assign,
+        }
+        table = pa.Table.from_pandas(table, preserve_index=False)
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), _META_KEY: json.dumps(meta)})
+        pq.write_table(table, path, compression=compression)
+
+    @classmethod
+    def load(cls, path, source, target, keep_geometry = True, assign = 'intersection'):
+        """
+        Reads pieces written by save. Returns None when the file does not
+        exist, was written for different source or target geometries or
+        another assign mode, or lacks piece geometry that keep_geometry asks
+        for.
+
+        Parameters
+        ----------
+        path : str
+            Parquet file to read.
+        source : GeoDataFrame
+            Source polygons.
+        target : GeoDataFrame
+            Target polygons.
+        keep_geometry : bool, optional
+            Piece geometry is needed. The default is True.
+        assign : str, optional
+            Assign mode the pieces must have been built with. The default is
+            'intersection'.
+        Returns
+        -------
+        index : IntersectionIndex or None
+            Stored intersection of source and target.
+        """
+        import pyarrow.parquet as pq
+
+        if not os.path.exists(path):
+            return None
+        meta = pq.read_schema(path).metadata or {}
+        if _META_KEY not in meta:
+            return None
+        meta = json.loads(meta[_META_KEY])
+        if keep_geometry and not meta['geometry']:
+            return None
+        if meta.get('assign', 'intersection') != assign:
+            return None
+        if (meta['source_fingerprint'] != geometry_fingerprint(source)
+                or meta['target_fingerprint'] != geometry_fingerprint(target)):
+            return None
+
+        columns = ['source_id', 'target_id', 'intersect_area']
+        if keep_geometry:
+            columns.append('geometry')
+        table = pq.read_table(path, columns=columns).to_pandas()
+        geometry = None
+        if keep_geometry:
+            geometry = gpd.GeoSeries.from_wkb(table['geometry'], crs=source.crs)
+
+        index = cls.__new__(cls)
+        index._set_layers(source, target)
+        index.assign = assign
+        index._set_pieces(table['source_id'], table['target_id'], table['intersect_area'], geometry)
+        return index
+
+    def __len__(self):
+        return len(self.area)
+
+    def take(self, keep):
+        """
+        Returns a new IntersectionIndex with only the pieces where keep is
+        True.
+        """
+        subset = copy.copy(self)
+        subset.source_pos = self.source_pos[keep]
+        subset.target_pos = self.target_pos[keep]
+        subset.area = self.area[keep]
+        if self.geometry is not None:
+            subset.geometry = self.geometry[keep].reset_index(drop=True)
+        return subset
+
+    def check(self, source, target):
+        """
+        Raises ValueError if source and target are not the frames the index
+        was built from, comparing their index labels and polygon areas.
+        """
+        if not (self.source_index.equals(source.index)
+                and self.target_index.equals(target.index)
+                and _same_areas(self.source_area, source)
+                and _same_areas(self.target_area, target)):
+            raise ValueError("IntersectionIndex was built from different "
+                             "source or target polygons")
+
+    def join(self, source, target, source_cols = None, target_cols = None):
+        """
+        Builds the intersected GeoDataFrame by attaching source and target
+        attributes to every piece. Column names shared by both sides get the
+        same '_1' and '_2' suffixes as gpd.overlay.
+
+        Parameters
+        ----------
+        source : DataFrame
+            Source attributes, in the order the index was built from.
+        target : DataFrame
+            Target attributes, in the order the index was built from.
+        source_cols : list, optional
+            Source columns to attach. The default is every attribute column.
+        target_cols : list, optional
+            Target columns to attach. The default is every attribute column.
+        Returns
+        -------
+        pieces : GeoDataFrame
+            One row per piece with the requested attributes.
+        """
+        if self.geometry is None:
+            raise ValueError("IntersectionIndex was built without geometry")
+        left = _attributes(source, source_cols).iloc[self.source_pos]
+        right = _attributes(target, target_cols).iloc[self.target_pos]
+        left = left.reset_index(drop=True)
+        right = right.reset_index(drop=True)
+        attrs = left.join(right, lsuffix='_1', rsuffix='_2')
+        return gpd.GeoDataFrame(attrs, geometry=self.geometry.values, crs=self.crs)
+
+
+_META_KEY = b'sp_interpolate'
+_POLYGON_TYPES = (3, 6)
+_COLLECTION_TYPE = 7
+
+
+def geometry_fingerprint(frame):
+    """
+    Returns a hex digest of the geometries of frame, in order.
+    """
+    digest = hashlib.sha1()
+    for wkb in frame.geometry.to_wkb():
+        digest.update(wkb or b'')
+    return digest.hexdigest()
+
+
+def dissolved_join(source, mask, source_cols = None):
+    """
+    Clips every source polygon to the union of the mask polygons that
+    overlap it, so each source polygon gives at most one piece however
+    fragmented the mask is.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    mask : GeoDataFrame
+        Mask polygons, e.g. the land cover classes that are kept.
+    source_cols : list, optional
+        Source columns to attach. The default is every attribute column.
+    Returns
+    -------
+    pieces : GeoDataFrame
+        One row per source polygon that overlaps the mask, in source order,
+        with the requested attributes like IntersectionIndex.join.
+    """
+    source_pos, mask_pos = mask.sindex.query(source.geometry.values, predicate='intersects')
+    order = np.lexsort((mask_pos, source_pos))
+    source_pos, mask_pos = source_pos[order], mask_pos[order]
+
+    #union the mask polygons under each source polygon, then clip it once
+    unions = group_union(source_pos, np.asarray(_valid(mask.geometry.values))[mask_pos])
+    source_pos = source_pos[group_first(source_pos)]
+    source_geoms = np.asarray(_valid(source.geometry.values))[source_pos]
+    geometry = _polygonal(shapely.intersection(source_geoms, unions))
+    keep = ~shapely.is_missing(geometry)
+    keep[keep] = shapely.area(geometry[keep]) > 0
+
+    attrs = _attributes(source, source_cols).iloc[source_pos[keep]].reset_index(drop=True)
+    return gpd.GeoDataFrame(attrs, geometry=geometry[keep], crs=source.crs)
+
+
+def intersection_index(index, source, target, cache = None, keep_geometry = True,
+                       assign = 'intersection', tile_size = None, workers = None,
+                       keys = None):
+    """
+    Returns index after checking it matches source and target. If index is
+    None the intersection is read from cache when it was saved for the same
+    geometries, otherwise it is computed and saved to cache. Pieces matched
+    by keys are cheaper to rebuild than to read and are not cached.
+    """
+    if index is not None:
+        index.check(source, target)
+        return index
+    if keys is not None:
+        print("matching polygons by key")
+        return IntersectionIndex(source, target, keep_geometry, 'key', keys=keys)
+    if cache is not None:
+        index = IntersectionIndex.load(cache, source, target, keep_geometry, assign)
+        if index is not None:
+            print("reusing saved intersection")
+            return index
+    print("intersecting polygons")
+    index = IntersectionIndex(source, target, keep_geometry, assign, tile_size, workers)
+    if cache is not None:
+        print("saving intersection")
+        index.save(cache, source, target)
+    return index
+
+
+def _overlay_pieces(source, target):
+    source_pos, target_pos, left, right, inside, crossing = _pairs(source, target)
+
+    #polygonal part of each intersection, as gpd.overlay keeps it
+    geometry = np.where(inside, right, left)
+    geometry[crossing] = _polygonal(shapely.intersection(left[crossing], right[crossing]))
+    keep = ~shapely.is_missing(geometry)
+    geometry = geometry[keep]
+    return source_pos[keep], target_pos[keep], shapely.area(geometry), geometry
+
+
+def _area_pieces(source, target):
+    source_pos, target_pos, left, right, inside, crossing = _pairs(source, target)
+
+    #area of each pair's intersection
+    area = np.where(inside, shapely.area(right), shapely.area(left))
+    area[crossing] = shapely.area(shapely.intersection(left[crossing], right[crossing]))
+    keep = area > 0
+    return source_pos[keep], target_pos[keep], area[keep], None
+
+
+def _pairs(source, target):
+    #candidate pairs from the spatial index, as gpd.overlay finds them
+    source_pos, target_pos = target.sindex.query(source.values, predicate='intersects')
+    order = np.lexsort((target_pos, source_pos))
+    source_pos, target_pos = source_pos[order], target_pos[order]
+
+    #pairs where one polygon lies inside the other need no clipping, their
+    #intersection is the inner polygon, so only pairs whose edges cross are clipped
+    source_geoms = np.asarray(_valid(source.values))
+    target_geoms = np.asarray(_valid(target.values))
+    shapely.prepare(source_geoms)
+    shapely.prepare(target_geoms)
+    left, right = source_geoms[source_pos], target_geoms[target_pos]
+    inside = shapely.contains_properly(left, right)
+    crossing = ~inside
+    crossing[crossing] = ~shapely.contains_properly(right[crossing], left[crossing])
+    return source_pos, target_pos, left, right, inside, crossing
+
+
+def _polygonal(geoms):
+    #keep the polygons of each geometry, None where there are none
+    polygon = np.isin(shapely.get_type_id(geoms), _POLYGON_TYPES)
+    for i in np.flatnonzero(shapely.get_type_id(geoms) == _COLLECTION_TYPE):
+        parts = shapely.get_parts(geoms[i])
+        parts = parts[np.isin(shapely.get_type_id(parts), _POLYGON_TYPES)]
+        if len(parts):
+            geoms[i] = shapely.union_all(parts)
+            polygon[i] = True
+    geoms[polygon] = shapely.make_valid(geoms[polygon])
+    geoms[~polygon] = None
+    return geoms
+
+
+def _valid(geoms):
+    invalid = ~geoms.is_valid
+    if invalid.any():
+        geoms = geoms.copy()
+        geoms[invalid] = geoms[invalid].make_valid()
+    return geoms
+
+
+def _point_pieces(source, target, exact):
+    #match the representative point of every target polygon to a source polygon
+    points = target.geometry.representative_point()
+    target_pos, source_pos = source.sindex.query(points.values, predicate='intersects')
+
+    #points on a shared edge fall in more than one source polygon, keep the first
+    order = np.lexsort((source_pos, target_pos))
+    target_pos, first = np.unique(target_pos[order], return_index=True)
+    source_pos = source_pos[order][first]
+
+    target_geoms = np.asarray(target.geometry.values)
+    if exact:
+        #target polygons not covered by their source polygon are clipped exactly
+        covered = source.geometry.iloc[source_pos].reset_index(drop=True).covers(
+            target.geometry.iloc[target_pos].reset_index(drop=True)).to_numpy()
+        source_pos = source_pos[covered]
+        target_pos = target_pos[covered]
+        crossing = np.setdiff1d(np.arange(len(target)), target_pos)
+    area = np.asarray(target.geometry.area, dtype=float)[target_pos]
+    geometry = target_geoms[target_pos]
+
+    if exact and len(crossing):
+        clipped = _overlay_pieces(source, target.iloc[crossing])
+        source_pos = np.concatenate([source_pos, clipped[0]])
+        target_pos = np.concatenate([target_pos, crossing[clipped[1]]])
+        area = np.concatenate([area, clipped[2]])
+        geometry = np.concatenate([geometry, clipped[3]])
+
+    order = np.lexsort((target_pos, source_pos))
+    return source_pos[order], target_pos[order], area[order], geometry[order]
+
+
+def _key_pieces(source, target, keys):
+    #hash join of target keys to source keys, every target polygon is one piece
+    source_col, target_col, *prefix = keys
+    source_keys = pd.Index(source[source_col])
+    target_keys = target[target_col]
+    if prefix and prefix[0]:
+        source_keys = source_keys.astype(str)
+        target_keys = target_keys.astype(str).str[:prefix[0]]
+    if not source_keys.is_unique:
+        raise ValueError("source keys in {} must be unique".format(source_col))
+    source_pos = source_keys.get_indexer(target_keys)
+
+    #targets without a matching source get no piece
+    target_pos = np.flatnonzero(source_pos >= 0)
+    source_pos = source_pos[target_pos]
+    order = np.argsort(source_pos, kind='stable')
+    source_pos, target_pos = source_pos[order], target_pos[order]
+    area = np.asarray(target.geometry.area, dtype=float)[target_pos]
+    geometry = np.asarray(target.geometry.values)[target_pos]
+    return source_pos, target_pos, area, geometry
+
+
+def _tiles(source, tile_size):
+    #tile of every source polygon from the center of its bounding box
+    bounds = source.bounds.to_numpy()
+    center_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    center_y = (bounds[:, 1] + bounds[:, 3]) / 2
+    tile_x = np.floor((center_x - np.nanmin(center_x)) / tile_size).astype(np.int64)
+    tile_y = np.floor((center_y - np.nanmin(center_y)) / tile_size).astype(np.int64)
+    tile = tile_y * (tile_x.max() + 1) + tile_x
+    order = np.argsort(tile, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(tile[order])) + 1)
+
+
+def _curve_runs(source, n_parts):
+    #split source polygons into runs of neighbours along a Hilbert curve
+    order = np.argsort(source.hilbert_distance(), kind='stable')
+    return [part for part in np.array_split(order, n_parts) if len(part)]
+
+
+def _partitioned_pieces(source, target, build, parts, keep_geometry, workers):
+    #targets each part of the source polygons can reach
+    jobs = []
+    for source_pos in parts:
+        tile_source = source.iloc[source_pos]
+        target_pos = np.unique(target.sindex.query(tile_source.values, predicate='intersects')[1])
+        if len(target_pos):
+            jobs.append((source_pos, target_pos))
+
+    #build the pieces of each part, in worker processes if asked
+    args = ((build, source.iloc[source_pos], target.iloc[target_pos], keep_geometry)
+            for source_pos, target_pos in jobs)
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(_build_part, args))
+    else:
+        results = [_build_part(arg) for arg in args]
+
+    if not results:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=float), np.array([], dtype=object)
+    source_pos = np.concatenate([job[0][res[0]] for job, res in zip(jobs, results)])
+    target_pos = np.concatenate([job[1][res[1]] for job, res in zip(jobs, results)])
+    area = np.concatenate([res[2] for res in results])
+    geometry = np.concatenate([res[3] for res in results]) if keep_geometry else None
+
+    #same order as building all pieces at once
+    order = np.lexsort((target_pos, source_pos))
+    return (source_pos[order], target_pos[order], area[order],
+            geometry[order] if keep_geometry else None)
+
+
+def _build_part(job):
+    build, source, target, keep_geometry = job
+    source_pos, target_pos, area, geometry = build(source, target)
+    return source_pos, target_pos, area, geometry if keep_geometry else None
+
+
+def _first_per_target(source_pos, target_pos, area, geometry):
+    #keep one piece per target polygon, from the first source polygon
+    order = np.lexsort((source_pos, target_pos))
+    first = order[np.unique(target_pos[order], return_index=True)[1]]
+    first.sort()
+    return (source_pos[first], target_pos[first], area[first],
+            None if geometry is None else geometry[first])
+
+
+def _same_areas(areas, frame):
+    #cheap geometry signature, the area of every polygon in order
+    return np.allclose(areas, frame.geometry.area, equal_nan=True)
+
+
+def _attributes(frame, cols):
+    #attribute columns of frame, leaving out any geometry columns
+    if cols is None:
+        cols = [col for col, dtype in frame.dtypes.items() if dtype != 'geometry']
+    return frame[list(cols)]
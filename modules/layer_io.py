@@ -0,0 +1,188 @@
+import importlib.util
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+ENGINES = ('arrow', 'pyogrio', 'fiona')
+PARQUET_EXTENSIONS = ('.parquet', '.geoparquet')
+FEATHER_EXTENSIONS = ('.feather', '.arrow')
+TABLE_EXTENSIONS = ('.csv', *PARQUET_EXTENSIONS, *FEATHER_EXTENSIONS)
+
+
+def read_layer(path, columns = None, bbox = None, engine = None):
+    """
+    Reads a vector layer into a GeoDataFrame. GeoParquet (.parquet,
+    .geoparquet) and Feather (.feather, .arrow) files are read with pyarrow,
+    other files with the I/O engine.
+    Parameters
+    ----------
+    path : str
+        File to read.
+    columns : list, optional
+        Attribute columns to read, the geometry is always read. The default
+        is None, which reads every column.
+    bbox : GeoSeries or tuple, optional
+        Only read features whose bounding box intersects this extent, e.g.
+        extent(other_layer). A GeoSeries is reprojected to the layer, a
+        (minx, miny, maxx, maxy) tuple is in the layer's crs. GeoParquet
+        files written without a bbox column, and Feather files, are read
+        whole and then filtered. The default is None, which reads every
+        feature. When the extent or the layer has no crs, the coordinates of
+        the extent are used as they are.
+    engine : str, optional
+        'arrow' reads with pyogrio through Arrow, 'pyogrio' reads with
+        pyogrio feature by feature, 'fiona' uses the fiona path. The default
+        is None, which picks the first of these that is installed.
+    Returns
+    -------
+    layer : GeoDataFrame
+        Features of the layer.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(columns))
+    extension = _extension(path)
+    if extension not in PARQUET_EXTENSIONS + FEATHER_EXTENSIONS:
+        if _is_frame(bbox):
+            #the crs of the file, from a read without features
+            crs = gpd.read_file(path, rows=0, **_engine_options(engine)).crs
+            bbox = _bounds(bbox, crs)
+        return gpd.read_file(path, columns=columns, bbox=bbox, **_engine_options(engine))
+
+    geo = _geo_metadata(path, extension)
+    geometry = geo['primary_column']
+    if columns is not None:
+        columns.append(geometry)
+    if extension in FEATHER_EXTENSIONS:
+        return _filter_bbox(gpd.read_feather(path, columns=columns), bbox)
+    if bbox is not None and 'covering' in geo['columns'][geometry]:
+        #row groups and rows outside the extent are skipped using the bbox column
+        if _is_frame(bbox):
+            crs = geo['columns'][geometry].get('crs', 'OGC:CRS84')
+            bbox = _bounds(bbox, _parquet_crs(crs))
+        return gpd.read_parquet(path, columns=columns, bbox=bbox)
+    return _filter_bbox(gpd.read_parquet(path, columns=columns), bbox)
+
+
+def extent(frame):
+    """
+    Returns the bounding box of a GeoDataFrame as a one-polygon GeoSeries in
+    its crs, to filter the reading of another layer with read_layer.
+    """
+    return gpd.GeoSeries([shapely.box(*frame.total_bounds)], crs=frame.crs)
+
+
+def write_layer(frame, path, engine = None, compression = 'zstd', row_group_size = None):
+    """
+    Writes a GeoDataFrame to a file, with the format taken from the file
+    extension: GeoParquet (.parquet, .geoparquet), Feather (.feather,
+    .arrow), or any vector driver of the I/O engine. DataFrames without
+    geometry, such as attribute tables, can be written to these columnar
+    formats or to .csv.
+    Parameters
+    ----------
+    frame : GeoDataFrame
+        Features to write.
+    path : str
+        File to write.
+    engine : str, optional
+        Same choices as read_layer. The default is None.
+    compression : str, optional
+        Compression codec for GeoParquet and Feather, e.g. 'zstd', 'snappy',
+        'lz4' or None. The default is 'zstd'.
+    row_group_size : int, optional
+        Rows per GeoParquet row group, or per Feather record batch. The
+        default is None, which leaves it to pyarrow.
+    """
+    extension = _extension(path)
+    if extension in PARQUET_EXTENSIONS:
+        options = {} if row_group_size is None else {'row_group_size': row_group_size}
+        if isinstance(frame, gpd.GeoDataFrame):
+            #a bbox column lets read_layer skip features outside an extent
+            options['write_covering_bbox'] = True
+        frame.to_parquet(path, compression=compression, **options)
+    elif extension in FEATHER_EXTENSIONS:
+        options = {} if row_group_size is None else {'chunksize': row_group_size}
+        frame.to_feather(path, compression=compression or 'uncompressed', **options)
+    elif extension == '.csv' and not isinstance(frame, gpd.GeoDataFrame):
+        #keep the index only when it identifies rows, e.g. target polygons
+        frame.to_csv(path, index=not isinstance(frame.index, pd.RangeIndex))
+    else:
+        frame.to_file(path, **_engine_options(engine))
+
+
+def default_engine():
+    """
+    Returns the fastest I/O engine that is installed.
+    """
+    if _installed('pyogrio'):
+        import pyogrio
+        #Arrow reads and writes need pyarrow and GDAL 3.6 or later
+        if _installed('pyarrow') and pyogrio.__gdal_version__ >= (3, 6, 0):
+            return 'arrow'
+        return 'pyogrio'
+    return 'fiona'
+
+
+def _engine_options(engine):
+    engine = engine or default_engine()
+    if engine == 'arrow':
+        return {'engine': 'pyogrio', 'use_arrow': True}
+    if engine in ENGINES:
+        return {'engine': engine}
+    raise ValueError("engine must be one of {}".format(", ".join(ENGINES)))
+
+
+def _geo_metadata(path, extension):
+    #GeoParquet metadata of the file schema, naming the geometry columns
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if extension in PARQUET_EXTENSIONS:
+        schema = pq.read_schema(path)
+    else:
+        with pa.memory_map(str(path)) as source:
+            schema = pa.ipc.open_file(source).schema
+    return json.loads(schema.metadata[b'geo'])
+
+
+def _parquet_crs(crs):
+    #crs is PROJJSON in GeoParquet metadata, null for an undefined crs
+    from pyproj import CRS
+
+    if crs is None:
+        return None
+    return CRS.from_json_dict(crs) if isinstance(crs, dict) else CRS.from_user_input(crs)
+
+
+def _filter_bbox(frame, bbox):
+    #keep the features whose bounding box intersects bbox
+    if bbox is None:
+        return frame
+    if _is_frame(bbox):
+        bbox = _bounds(bbox, frame.crs)
+    keep = np.sort(frame.sindex.query(shapely.box(*bbox)))
+    return frame.iloc[keep].reset_index(drop=True)
+
+
+def _is_frame(bbox):
+    return isinstance(bbox, (gpd.GeoSeries, gpd.GeoDataFrame))
+
+
+def _bounds(bbox, crs):
+    #bounds of a GeoSeries extent in crs, as they are when either crs is missing
+    if crs is not None and bbox.crs is not None:
+        bbox = bbox.to_crs(crs)
+    return tuple(bbox.total_bounds)
+
+
+def _extension(path):
+    return os.path.splitext(str(path))[1].lower()
+
+
+def _installed(module):
+    return importlib.util.find_spec(module) is not None
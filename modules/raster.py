@@ -0,0 +1,232 @@
+import contextlib
+import os
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from modules.aggregate import group_union
+from modules.intersection import _polygonal
+
+
+def is_raster(ancillary):
+    """
+    Returns True if ancillary is a raster file path or an open rasterio
+    dataset rather than a DataFrame of polygons.
+    """
+    if isinstance(ancillary, (str, os.PathLike)):
+        return True
+    return hasattr(ancillary, 'read') and hasattr(ancillary, 'transform')
+
+
+def class_areas(source, raster, band = 1):
+    """
+    Area of every raster class under each source polygon, from zonal pixel
+    counts. Source polygons are rasterized once onto the raster grid by
+    pixel center, so no vector overlay is needed.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    raster : str or rasterio dataset
+        Land cover raster with one class value per pixel.
+    band : int, optional
+        Raster band holding the classes. The default is 1.
+    Returns
+    -------
+    source_pos : ndarray
+        Position in source of each (source, class) pair with pixels.
+    classes : ndarray
+        Class value of each pair.
+    area : ndarray
+        Area of the pixels of each pair, in raster units.
+    """
+    values, (source_ids,), pixel_area = _burn(raster, [source], band)
+    classes, class_codes = np.unique(values, return_inverse=True)
+    pairs, counts = np.unique(source_ids * len(classes) + class_codes, return_counts=True)
+    return pairs // len(classes), classes[pairs % len(classes)], counts * pixel_area
+
+
+def masked_areas(source, raster, exclude = (), target = None, band = 1):
+    """
+    Area of the raster pixels under each source polygon whose class is not
+    excluded, split by target polygon when target is given.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    raster : str or rasterio dataset
+        Land cover raster with one class value per pixel.
+    exclude : list, optional
+        Class values to mask out. The default is ().
+    target : GeoDataFrame, optional
+        Target polygons rasterized onto the same grid. The default is None.
+    band : int, optional
+        Raster band holding the classes. The default is 1.
+    Returns
+    -------
+    source_pos : ndarray
+        Position in source of each pair with kept pixels.
+    target_pos : ndarray
+        Position in target of each pair, -1 for kept pixels outside every
+        target polygon, all 0 without target.
+    area : ndarray
+        Area of the kept pixels of each pair, in raster units.
+    """
+    layers = [source] if target is None else [source, target]
+    values, ids, pixel_area = _burn(raster, layers, band)
+    kept = ~np.isin(values, exclude)
+    source_ids = ids[0][kept]
+    if target is None:
+        target_ids, n_target = np.zeros(len(source_ids), dtype=np.int64), 1
+    else:
+        target_ids, n_target = ids[1][kept], len(target)
+    pairs, counts = np.unique(source_ids * (n_target + 1) + target_ids + 1, return_counts=True)
+    return pairs // (n_target + 1), pairs % (n_target + 1) - 1, counts * pixel_area
+
+
+def masked_shapes(source, raster, exclude = (), band = 1):
+    """
+    Kept raster pixels under each source polygon as one polygon. Pixels
+    whose class is not excluded are polygonized per source polygon, by
+    pixel center, and the result is clipped to the source polygon.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    raster : str or rasterio dataset
+        Land cover raster with one class value per pixel.
+    exclude : list, optional
+        Class values to mask out. The default is ().
+    band : int, optional
+        Raster band holding the classes. The default is 1.
+    Returns
+    -------
+    source_pos : ndarray
+        Position in source of each polygon with kept pixels.
+    geometry : GeoSeries
+        Kept part of each of these source polygons, in the crs of source.
+    """
+    from rasterio import features
+
+    values, valid, (source_ids,), transform, (layer,) = _read_grid(raster, [source], band)
+    kept = valid & ~np.isin(values, exclude)
+    shapes = list(features.shapes(np.where(kept, source_ids, -1).astype('int32'), mask=kept,
+                                  transform=transform))
+    ids = np.array([value for geom, value in shapes], dtype=np.int64)
+    geoms = np.empty(len(shapes), dtype=object)
+    geoms[:] = [shapely.geometry.shape(geom) for geom, value in shapes]
+
+    #union the pixel shapes of each source polygon, then clip them to it
+    order = np.argsort(ids, kind='stable')
+    ids, geoms = ids[order], geoms[order]
+    source_pos = np.unique(ids)
+    clip = np.asarray(layer.geometry.values)[source_pos]
+    geometry = _polygonal(shapely.intersection(group_union(ids, geoms), clip))
+    keep = ~shapely.is_missing(geometry)
+    keep[keep] = shapely.area(geometry[keep]) > 0
+    geometry = gpd.GeoSeries(geometry[keep], crs=layer.crs)
+    if source.crs is not None and layer.crs != source.crs:
+        geometry = geometry.to_crs(source.crs)
+    return source_pos[keep], geometry
+
+
+def grid_weights(source, target, resolution):
+    """
+    Approximate target by source areal weights from a grid. Source and
+    target polygons are rasterized by pixel center onto a shared grid of
+    square pixels, and each weight is the count of pixels a source and a
+    target polygon share over the pixel count of the source polygon.
+
+    Parameters
+    ----------
+    source : GeoDataFrame
+        Source polygons.
+    target : GeoDataFrame
+        Target polygons, in the same crs as source.
+    resolution : float
+        Pixel size in layer units.
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Weights with one row per target and one column per source.
+    error : float
+        Largest relative difference between the pixel area and the exact
+        area of any source or target polygon.
+    """
+    from rasterio import transform as transforms
+    from scipy import sparse
+
+    #shared grid over both layers
+    bounds = np.vstack([source.total_bounds, target.total_bounds])
+    min_x, min_y = bounds[:, :2].min(axis=0)
+    max_x, max_y = bounds[:, 2:].max(axis=0)
+    shape = (max(int(np.ceil((max_y - min_y) / resolution)), 1),
+             max(int(np.ceil((max_x - min_x) / resolution)), 1))
+    transform = transforms.from_origin(min_x, max_y, resolution, resolution)
+    source_ids, target_ids = (ids.ravel() for ids in _rasterize([source, target], shape, transform))
+
+    #pixel counts per polygon, and per pair of polygons sharing pixels
+    source_count = np.bincount(source_ids[source_ids >= 0], minlength=len(source))
+    target_count = np.bincount(target_ids[target_ids >= 0], minlength=len(target))
+    both = (source_ids >= 0) & (target_ids >= 0)
+    pairs, codes = np.unique(source_ids[both] * len(target) + target_ids[both], return_inverse=True)
+    counts = np.bincount(codes, minlength=len(pairs))
+    source_pos, target_pos = pairs // len(target), pairs % len(target)
+    weights = sparse.csr_matrix((counts / source_count[source_pos], (target_pos, source_pos)),
+                                shape=(len(target), len(source)))
+
+    #relative area error of the grid against the polygons
+    pixel_area = resolution * resolution
+    areas = np.concatenate([source.geometry.area, target.geometry.area])
+    pixels = np.concatenate([source_count, target_count]) * pixel_area
+    error = np.max(np.abs(pixels - areas) / areas, initial=0)
+    return weights, float(error)
+
+
+def _rasterize(layers, shape, transform):
+    #burn the position of every polygon of each layer, -1 outside every polygon
+    from rasterio import features
+
+    ids = []
+    for layer in layers:
+        shapes = zip(layer.geometry.values, np.arange(1, len(layer) + 1))
+        burned = features.rasterize(shapes, out_shape=shape, transform=transform,
+                                    fill=0, dtype='int32')
+        ids.append(burned.astype(np.int64) - 1)
+    return ids
+
+
+def _burn(raster, layers, band):
+    #pixels without data or outside every polygon of the first layer are dropped,
+    #pixels outside the other layers get position -1
+    values, valid, ids, transform, layers = _read_grid(raster, layers, band)
+    pixel_area = abs(transform.a * transform.e - transform.b * transform.d)
+    return values[valid], [layer_ids[valid] for layer_ids in ids], pixel_area
+
+
+def _read_grid(raster, layers, band):
+    #read the band over the first layer's extent and burn polygon positions onto it,
+    #valid marks pixels with data inside the first layer; layers come back in the raster crs
+    import rasterio
+    from rasterio import windows
+
+    opened = rasterio.open(raster) if isinstance(raster, (str, os.PathLike)) else contextlib.nullcontext(raster)
+    with opened as dataset:
+        layers = [layer if dataset.crs is None or layer.crs is None or layer.crs == dataset.crs
+                  else layer.to_crs(dataset.crs) for layer in layers]
+        bounds = windows.from_bounds(*layers[0].total_bounds, transform=dataset.transform)
+        col_off, row_off = int(np.floor(bounds.col_off)), int(np.floor(bounds.row_off))
+        window = windows.Window(col_off, row_off,
+                                int(np.ceil(bounds.col_off + bounds.width)) - col_off,
+                                int(np.ceil(bounds.row_off + bounds.height)) - row_off)
+        window = window.intersection(windows.Window(0, 0, dataset.width, dataset.height))
+        values = dataset.read(band, window=window, masked=True)
+        transform = dataset.window_transform(window)
+
+    ids = _rasterize(layers, values.shape, transform)
+    valid = ~np.ma.getmaskarray(values) & (ids[0] >= 0)
+    return np.ma.getdata(values), valid, ids, transform, layers
@@ -1,8 +1,16 @@
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 
+from modules.aggregate import group_first, group_share, group_sum, group_union
+from modules.intersection import IntersectionIndex, dissolved_join, intersection_index
+from modules.raster import class_areas, grid_weights, is_raster, masked_areas, masked_shapes
+from modules.weights import apply_weights, areal_weights, has_weight, share_weights
 
-def arealwt(source, target, cols = [None], suffix = ''):
+
+def arealwt(source, target, cols = [None], suffix = '', index = None,
+            weights = None, return_weights = False, cache = None, tile_size = None,
+            workers = None, attributes_only = False, target_id = None, keys = None,
+            resolution = None):
     """
     Interpolates values from source polygons into target polygons using simple
     areal weighting.
@@ -16,54 +24,94 @@ def arealwt(source, target, cols = [None], suffix = ''):
         Column(s) from source to be interpolated. 
     suffix : str, optional
         New name for interpolated columns. The default is ''.
+    index : IntersectionIndex, optional
+        Precomputed intersection of source and target. The default is None.
+    weights : scipy.sparse matrix, optional
+        Target by source areal weights from a previous run. The intersection
+        is skipped when given. The default is None.
+    return_weights : bool, optional
+        Also return the weight matrix. The default is False.
+    cache : str, optional
+        Parquet file for the intersection. It is reused when it was saved for
+        the same source and target geometries, and written otherwise. The
+        default is None.
+    tile_size : float, optional
+        Build the intersection tile by tile on square tiles of this size to
+        bound memory. The default is None.
+    workers : int, optional
+        Build the intersection in this many processes. The default is None.
+    attributes_only : bool, optional
+        Return a plain attribute table of the interpolated columns without
+        target geometry. The default is False.
+    target_id : str or list, optional
+        Target column(s) identifying the rows of the attribute table. The
+        default is None, which keys the table by the target index.
+    keys : tuple, optional
+        (source_col, target_col) or (source_col, target_col, prefix) for
+        targets that nest in sources. Each target polygon goes whole to the
+        source whose source_col equals its target_col, or the first prefix
+        characters of it, instead of being intersected. The default is None.
+    resolution : float, optional
+        Approximate the weights on a grid of square pixels of this size
+        instead of intersecting polygons, and print the largest relative
+        area error of any polygon on that grid. Needs rasterio. The default
+        is None.
     Returns
     -------
     final : Dataframe
-        Target dataframe with interpolated columns added.
+        Target dataframe with interpolated columns added, or the attribute
+        table if attributes_only is True.
+    weights : scipy.sparse.csr_matrix
+        Target by source areal weights, only if return_weights is True.
     """
-    #reindex for sum of interpolated results to merge later
-    target['_index'] = target.index
-    
-    #calculate source areas
-    print("calculating source area")
-    source['source_area'] = source.geometry.area
-    
-    #intersect source and target
-    print("calculating target area")
-    joined1 = gpd.overlay(source, target, how = 'intersection')
-    
-    #calculate intersected areas
-    print("calculating intersected area")
-    joined1['intersect_area'] = joined1.geometry.area
-    
-    #calculate areal weight per intersected polygon
-    print("calculating areal weight")
-    joined1["AREAL_WT"] = joined1['intersect_area'] / joined1['source_area']    
+    if weights is None and resolution:
+        #approximate weights from shared pixels on a grid
+        print("rasterizing polygons")
+        weights, error = grid_weights(source, target, resolution)
+        print("maximum relative area error: {:.4f}".format(error))
+    elif weights is None:
+        #intersect source and target, or reuse the given intersection
+        index = intersection_index(index, source, target, cache, keep_geometry=False,
+                                   tile_size=tile_size, workers=workers, keys=keys)
+        
+        #calculate areal weight per intersected polygon
+        print("calculating areal weight")
+        weights = areal_weights(index)
+    elif weights.shape != (len(target), len(source)):
+        raise ValueError("weights must have one row per target and one column per source")
     
-    #interpolate designated columns, create list to include in target dataframe
+    #interpolate all designated columns in one sparse product
     print("interpolating designated fields")
-    new_cols = []
-    for col in cols:
-        new_col = col + suffix
-        new_cols.append(new_col)
-        joined1[new_col] = joined1["AREAL_WT"] * joined1[col]
+    new_cols = [col + suffix for col in cols]
+    results = apply_weights(weights, source, cols)
     
-    #merge interpolated results to target dataframe
+    #add interpolated results to target polygons that intersect a source
     print("merging results")
-    results = joined1.groupby('_index').sum()
-    final = pd.merge(target, results[new_cols], on='_index')
-    del final['_index']
+    hit = has_weight(weights)
+    if attributes_only:
+        final = pd.DataFrame(results[hit], columns=new_cols, index=target.index[hit])
+        if target_id is not None:
+            id_cols = [target_id] if isinstance(target_id, str) else list(target_id)
+            ids = target[id_cols][hit].reset_index(drop=True)
+            final = pd.concat([ids, final.reset_index(drop=True)], axis=1)
+    else:
+        final = target[hit].reset_index(drop=True)
+        final[new_cols] = results[hit]
+    if return_weights:
+        return final, weights
     return final
 
 def binary_vector(source, ancillary, exclude_col=(), 
-                  exclude_val= [None], suffix= '', cols= [None]):
+                  exclude_val= [None], suffix= '', cols= [None], index= None, cache= None,
+                  tile_size= None, workers= None, dissolve= False, aggregate= None,
+                  keep_geometry= True, source_cols= None):
     """Calculates areal weight using the binary dasymmetric method.
     
     :param source: Name of Dataframe that contains values that should be interpolated
     :type source: string
-    :param ancillary: Name of dataframe containing ancillary geometry data, used to mask source dataframe
+    :param ancillary: Name of dataframe containing ancillary geometry data, used to mask source dataframe, or a land cover raster whose pixel values are the classes
     :type ancillary: string
-    :param exclude_col: Column name from ancillary dataframe that contains exclusionary values
+    :param exclude_col: Column name from ancillary dataframe that contains exclusionary values, not used for a raster
     :type exclude_col: string
     :param exclude_val: Values from exclude_col that should be removed during binary mask operation
     :type exclude_val: list
@@ -71,53 +119,77 @@ def binary_vector(source, ancillary, exclude_col=(),
     :type suffix: string
     :param cols: Column names that should be interpolated
     :type cols: list
-    
-    :return: Source dataframe with interpolated columns added
+    :param index: Precomputed intersection of source and the unmasked ancillary dataframe
+    :type index: IntersectionIndex
+    :param cache: Parquet file for the intersection of source and the kept ancillary polygons, reused when saved for the same geometries and written otherwise
+    :type cache: string
+    :param tile_size: Build the intersection tile by tile on square tiles of this size to bound memory
+    :type tile_size: float
+    :param workers: Build the intersection in this many processes
+    :type workers: int
+    :param dissolve: Union the kept ancillary polygons under each source polygon before intersecting, giving one masked polygon per source polygon instead of one per ancillary polygon. index, cache, tile_size and workers are not used
+    :type dissolve: bool
+    :param aggregate: 'source' to sum the masked pieces into one row per source polygon, or a GeoDataFrame of zones to interpolate the masked pieces into by areal weight. The default returns every masked piece
+    :type aggregate: string or GeoDataFrame
+    :param keep_geometry: With aggregate, dissolve the masked geometry of each source polygon, or keep the zone geometry. If False a table without geometry is returned
+    :type keep_geometry: bool
+    :param source_cols: Source columns to carry over to the result besides the interpolated ones. The default None carries over every source column
+    :type source_cols: list
+    
+    :return: Source dataframe with interpolated columns added. For a raster, the rows are source polygons clipped to their kept pixels, or the zones when aggregate is a GeoDataFrame
     :rtype: dataframe
     """    
-    # index group 
-    source['division'] = source.index
-           
-    #drop excluded rows from ancillary data
-    print("masking")
-    binary_mask = ancillary[exclude_col].isin(exclude_val)
-    ancillary = ancillary[~binary_mask]
-    
-    #drop all columns except geometry before join (don't want data from ancillary in final df)
-    ancillary = ancillary[['geometry']]
+    if is_raster(ancillary):
+        return _binary_raster(source, ancillary, exclude_val, suffix, cols, aggregate, keep_geometry,
+                              source_cols)
+    
+    if dissolve:
+        #clip each source polygon to the union of the kept ancillary polygons
+        print("dissolving mask")
+        binary_mask = ancillary[exclude_col].isin(exclude_val).to_numpy()
+        output = dissolved_join(source, ancillary[~binary_mask], _with_values(source_cols, cols))
+        
+        #one masked polygon per source polygon keeps all of its values
+        new_cols = [col + suffix for col in cols]
+        for col, new_col in zip(cols, new_cols):
+            output[new_col] = output[col]
+        output = _drop_values(output, source_cols, cols, new_cols)
+        if aggregate is not None:
+            return _aggregate_pieces(output, np.arange(len(output)), new_cols, aggregate, keep_geometry)
+        return output
+    
+    binary_mask = ancillary[exclude_col].isin(exclude_val).to_numpy()
+    if index is None:
+        #remove excluded rows from ancillary data before intersecting
+        print("masking")
+        ancillary = ancillary[~binary_mask]
+        index = intersection_index(None, source, ancillary, cache, tile_size=tile_size, workers=workers)
+    else:
+        #reuse the given intersection and drop pieces of excluded rows
+        index = intersection_index(index, source, ancillary)
+        print("masking")
+        index = index.take(~binary_mask[index.target_pos])
           
-    #intersect source file and ancillary file
-    print("overlaying shapefiles")
-    mask = gpd.overlay(source, ancillary, how='intersection')
-    
-    #calculate and store areas of intersected zone
-    print("calculating intersected areas")
-    mask['intersectarea'] = (mask.area)  
-
-    #calculate sum of polygon areas by tract
-    masksum = mask.groupby('division')['intersectarea'].sum()
-    
-    # merge summmed areas back to main dataframe
-    print("merging dataframes")
-    target = mask.merge(masksum, on='division')
+    #attach the carried over source data to intersected zones (don't want data from ancillary in final df)
+    output = index.join(source, ancillary, source_cols, target_cols=[])
+    division = index.source_pos
     
-    # calculate areal weight of areas
+    # calculate areal weight of each intersected zone within its tract
     print("calculating areal weight")
-    target["AREAL_WT"] = target['intersectarea_x'] / target['intersectarea_y']
+    areal_wt = group_share(division, index.area, len(source))
 
-    # loop through columns that user wants to interpolate, add suffix
-    new_cols = []
-    for col in cols:
-        new_col = col + suffix
-        new_cols.append(new_col)
-        target[new_col] = target["AREAL_WT"] * target[col]
+    # interpolate the columns that user wants from source by position, add suffix
+    new_cols = [col + suffix for col in cols]
+    values = source[cols].to_numpy(dtype=float)[division]
+    output[new_cols] = areal_wt[:, None] * values
     
-    # drop generated columns
-    output = target
-    output = output.drop(['division','intersectarea_x','intersectarea_y', 'AREAL_WT'], axis=1)
+    if aggregate is not None:
+        return _aggregate_pieces(output, division, new_cols, aggregate, keep_geometry)
     return output
 
-def parcel_method(zone, parcel, tu_col, ru_col, ba_col, ra_col, cols = [None]):     
+def parcel_method(zone, parcel, tu_col, ru_col, ba_col, ra_col, cols = [None], index = None, cache = None,
+                  assign = 'intersection', tile_size = None, workers = None, keys = None,
+                  zone_cols = None, parcel_cols = None):     
    
     """Interpolates values using the parcel based method.
     
@@ -135,59 +207,68 @@ def parcel_method(zone, parcel, tu_col, ru_col, ba_col, ra_col, cols = [None]):
     :type ra_col: string
     :param cols: Column names from Zone DataFrame containing values to interpolate. Can accept one or more columns.
     :type intp_col: list
+    :param index: Precomputed intersection of zone and parcel
+    :type index: IntersectionIndex
+    :param cache: Parquet file for the intersection, reused when saved for the same geometries and written otherwise
+    :type cache: string
+    :param assign: 'intersection' to clip parcels to zones, 'point' to assign whole parcels to the zone holding their representative point, or 'point_exact' to clip only the parcels that cross a zone edge
+    :type assign: string
+    :param tile_size: Build the intersection tile by tile on square tiles of this size to bound memory
+    :type tile_size: float
+    :param workers: Build the intersection in this many processes
+    :type workers: int
+    :param keys: (zone_col, parcel_col) or (zone_col, parcel_col, prefix) to assign whole parcels to the zone whose zone_col equals parcel_col, or its first prefix characters, instead of intersecting them
+    :type keys: tuple
+    :param zone_cols: Zone columns to carry over to the parcels. The default None carries over every zone column
+    :type zone_cols: list
+    :param parcel_cols: Parcel columns to carry over. The default None carries over every parcel column
+    :type parcel_cols: list
     
     :return: The parcel level DataFrame with two interpolated fields added for each column of input: One derived from residential units, and another derived from adjusted residential area
     :rtype: DataFrame
     """    
     
-    # make copies of zone and parcel dataframes
-    ara_parcel = parcel.copy()
-    zonecopy = zone.copy()
-    
     # calculate ara for parcels
     print("calculating adjusted residential area")
-    ara_parcel['M'] = ara_parcel.apply(lambda x: 1 if x[ra_col]==0 and x[ru_col] !=0 else 0, axis=1)
-    ara_parcel['ara'] = (ara_parcel['M'] *((ara_parcel[ba_col] * ara_parcel[ru_col]) / ara_parcel[tu_col])) + ara_parcel[ra_col]
+    ru, ara = _parcel_units(parcel, tu_col, ru_col, ba_col, ra_col)
+    
+    # intersect zone and parcels once, or reuse the given intersection
+    index = intersection_index(index, zone, parcel, cache, assign=assign, tile_size=tile_size,
+                               workers=workers, keys=keys)
+    intp_zone = index.join(zone, parcel, zone_cols, parcel_cols)
+    zone_pos = index.source_pos
+    n_zone = len(index.source_area)
+    piece_ara = ara[index.target_pos]
+    piece_ru = ru[index.target_pos]
     
     # sum ara for zone
     print("summing adjusted residential area")
-    zonecopy['_bindex'] = zonecopy.index
-    ara_zone = gpd.overlay(zonecopy, ara_parcel, how='intersection')
-    ara_zone = ara_zone.groupby('_bindex')['ara'].sum().reset_index(name='ara_zone')         
+    ara_zone = group_sum(zone_pos, piece_ara, n_zone)
             
     # calculate RU for zone
     print("calculating residential units")
-    ru_zone = gpd.overlay(zonecopy, parcel, how='intersection')
-    ru_zone = ru_zone.groupby('_bindex')[ru_col].sum().reset_index(name='ru_zone')  
+    ru_zone = group_sum(zone_pos, piece_ru, n_zone)
     
     # Calculate dasymetrically derived populations based on RU and ara
     print("interpolating based on residential units")
-    intp_zone = gpd.overlay(zonecopy, ara_parcel, how='intersection')
-    intp_zone = intp_zone.merge(ru_zone, on='_bindex')
-    intp_zone = intp_zone.merge(ara_zone, on='_bindex')
-    new_cols = []
-    for col in cols:
-        new_col = 'ru_derived_' + col 
-        new_cols.append(new_col)
-        intp_zone[new_col] = intp_zone[col] * intp_zone[ru_col] / intp_zone['ru_zone']
-    print("interpolating based on adjusted residential area")
-    new_cols = []    
-    for col in cols:
-        new_col = 'ara_derived_' + col 
-        new_cols.append(new_col)
-        intp_zone[new_col] = intp_zone[col] * intp_zone['ara'] / intp_zone['ara_zone']
-    
-    # drop generated columns that were just for calculations and indexing
-    intp_zone.drop(['M', '_bindex', 'ara', 'ru_zone', 'ara_zone'], axis=1, inplace = True)
+    values = zone[cols].to_numpy(dtype=float)[zone_pos]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intp_zone[['ru_derived_' + col for col in cols]] = values * (piece_ru / ru_zone[zone_pos])[:, None]
+        print("interpolating based on adjusted residential area")
+        intp_zone[['ara_derived_' + col for col in cols]] = values * (piece_ara / ara_zone[zone_pos])[:, None]
     return intp_zone
 
-def expert_system(large_zone, small_zone, parcel, tu_col, ru_col, ba_col, ra_col, intp_col):
+def expert_system(large_zone, small_zone, parcel, tu_col, ru_col, ba_col, ra_col, intp_col,
+                  small_index=None, assign='intersection', tile_size=None, workers=None):
         
     """Determines whether to use the residential unit or adjusted residential area dasymetric calculations
     for the parcel based method based on the expert system implementation. 
     Large and small interpolation zones must share the same column names for columns used in the arguments.
     Small intepolation zones must nest within large interpolation zones.
     
+    Parcels are only matched to the small zones. Each small zone is matched to the large zone holding its
+    representative point, and the large zone parcel method totals are summed up through that nesting.
+    
     :param large_zone: DataFrame with larger geography
     :type large_zone: Dataframe
     :param small_zone: DataFrame with smaller geography
@@ -202,55 +283,75 @@ def expert_system(large_zone, small_zone, parcel, tu_col, ru_col, ba_col, ra_col
     :type ba_col: string
     :param ra_col: Column name from parcel DataFrame containing residential area
     :type ra_col: string
-    :param intp_col: Column name from Zone DataFrame containing values to interpolate. Only accepts one column
-    :type intp_col: string
-    
-    :return: Dataframe at parcel level containing interpolated values based on expert system implementation
+    :param intp_col: Column name, or list of column names, from Zone DataFrame containing values to interpolate
+    :type intp_col: string or list
+    :param small_index: Precomputed intersection of small_zone and parcel
+    :type small_index: IntersectionIndex
+    :param assign: How parcels are matched to zones, see parcel_method
+    :type assign: string
+    :param tile_size: Build the intersection tile by tile on square tiles of this size to bound memory
+    :type tile_size: float
+    :param workers: Build the intersection in this many processes
+    :type workers: int
+    
+    :return: Dataframe at parcel level containing interpolated values based on expert system implementation, in expert_system_interpolation for a single column name or expert_system_<column> for a list
     :rtype: dataframe
     """    
     
-    # index small_zone
-    small_zone['index_s'] = small_zone.index
+    # columns to interpolate and where to put the selected estimates
+    if isinstance(intp_col, str):
+        cols = [intp_col]
+        expert_cols = ['expert_system_interpolation']
+    else:
+        cols = list(intp_col)
+        expert_cols = ['expert_system_' + col for col in cols]
+    
+    # match parcels to small zones once, or reuse the given intersection
+    small_index = intersection_index(small_index, small_zone, parcel, assign=assign, tile_size=tile_size,
+                                     workers=workers)
     
-    # call parcel method on large interpolation zone
-    print("performing parcel method on large zone")
-    expert_large = parcel_method(large_zone, parcel, tu_col, ru_col, ba_col, ra_col, [intp_col])    
     # call parcel method on small interpolation zone
     print("performing parcel method on small zone")
-    expert_small = parcel_method(small_zone, parcel, tu_col, ru_col, ba_col, ra_col, [intp_col])
-       
-    # overlay the interpolated large zone with small zone, so that it can later by grouped by small zone index
-    print("overlaying shapefiles")
-    expert = gpd.overlay(expert_large, small_zone, how='intersection')
-    
-    # sum ara at small zone level
-    print("summing adjusted residential area at small zone")
-    expert_ara = expert.groupby('index_s')['ara_derived_' + intp_col].sum().reset_index(name='expert_ara')    
-    # sum ru at small zone level
-    print("summing residential units at small zone")
-    expert_ru = expert.groupby('index_s')['ru_derived_' + intp_col].sum().reset_index(name='expert_ru')
-    
-    # merge ru and ara into same dataframe
-    print("merging dataframes")
-    expert_parcel = expert_ara.merge(expert_ru, on = 'index_s')
+    expert_parcel = parcel_method(small_zone, parcel, tu_col, ru_col, ba_col, ra_col, cols, small_index)
+    
+    # match small zones to the large zones they nest in
+    print("matching small zones to large zones")
+    nesting = IntersectionIndex(large_zone, small_zone, keep_geometry=False, assign='point')
+    if len(nesting) != len(small_zone):
+        raise ValueError("small zones must nest within large zones")
+    small_to_large = np.empty(len(small_zone), dtype=np.int64)
+    small_to_large[nesting.target_pos] = nesting.source_pos
+    
+    # sum ru and ara at small zone level, then up to large zone level
+    print("summing residential units and adjusted residential area")
+    ru, ara = _parcel_units(parcel, tu_col, ru_col, ba_col, ra_col)
+    zone_pos = small_index.source_pos
+    ru_small = group_sum(zone_pos, ru[small_index.target_pos], len(small_zone))
+    ara_small = group_sum(zone_pos, ara[small_index.target_pos], len(small_zone))
+    ru_large = group_sum(small_to_large, ru_small, len(large_zone))[small_to_large]
+    ara_large = group_sum(small_to_large, ara_small, len(large_zone))[small_to_large]
+    
+    # large zone parcel method estimates summed at small zone level, one column per field
+    large_value = large_zone[cols].to_numpy(dtype=float)[small_to_large]
+    small_value = small_zone[cols].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expert_ru = large_value * ru_small[:, None] / ru_large[:, None]
+        expert_ara = large_value * ara_small[:, None] / ara_large[:, None]
     
     # pop diff calculation
     print("calculating absolute values")
-    expert_parcel['ara_diff'] = abs(expert_small[intp_col] - expert_parcel['expert_ara'])
-    expert_parcel['ru_diff'] = abs(expert_small[intp_col] - expert_parcel['expert_ru'])
-    
-    # merge the aggregated data back with the small zone interpolated parcel dataframe
-    print("merging dataframes")
-    expert_parcel = expert_small.merge(expert_parcel, on='index_s')
-    
-    # apply the expert system
-    expert_parcel['expert_system_interpolation'] = expert_parcel.apply(lambda x: x['ru_derived_' + intp_col] 
-                                                           if x['ru_diff']<=x['ara_diff']
-                                                           else x['ara_derived_' + intp_col], axis=1)
-    expert_parcel.drop(['index_s', 'expert_ara', 'expert_ru', 'ara_diff', 'ru_diff'], axis=1, inplace = True)
+    ru_diff = np.abs(small_value - expert_ru)
+    ara_diff = np.abs(small_value - expert_ara)
+    
+    # apply the expert system per small zone and field, ru wins ties
+    use_ru = (ru_diff <= ara_diff)[zone_pos]
+    ru_derived = expert_parcel[['ru_derived_' + col for col in cols]].to_numpy(dtype=float)
+    ara_derived = expert_parcel[['ara_derived_' + col for col in cols]].to_numpy(dtype=float)
+    expert_parcel[expert_cols] = np.where(use_ru, ru_derived, ara_derived)
     return expert_parcel
 
-def  lim_var(source, ancillary, class_col, class_dict, cols = [None], source_identifier = '', suffix = ''):
+def  lim_var(source, ancillary, class_col, class_dict, cols = [None], source_identifier = '', suffix = '',
+             index = None, tile_size = None, workers = None):
     """
     Interpolates values into disaggregated source polygons using limiting variable method 
     with ancillary data. Thresholds are set for desired area-class categories.  Remaining
@@ -275,98 +376,77 @@ def  lim_var(source, ancillary, class_col, class_dict, cols = [None], source_ide
         Column that identifies source polygons. The default is ''.
     suffix : str, optional
         New name for interpolated columns. The default is ''.
+    index : IntersectionIndex, optional
+        Precomputed intersection of source and ancillary. The default is None.
+    tile_size : float, optional
+        Build the intersection tile by tile on square tiles of this size to
+        bound memory. The default is None.
+    workers : int, optional
+        Build the intersection in this many processes. The default is None.
     Returns
     -------
     target : DataFrame
         Target dataframe with interpolated columns.
     """
-    #calculate source area
-    print("calculating source area")
-    source['source_area'] = source.geometry.area
-    
-    #reindex for summing excess data and used area per source polygon
-    source['_index'] = source.index
-    
-    #intersect source and ancillary
-    print("overlaying shapefiles")
-    join1 = gpd.overlay(source, ancillary, how='intersection')
-    
-    #calculate intersected areas
-    print("calculating intersected areas")
-    join1['intersect_area']=join1.geometry.area
-    
-    #Assign thresholds to area classes
+    #intersect source and ancillary, or reuse the given intersection
+    index = intersection_index(index, source, ancillary, tile_size=tile_size, workers=workers)
+    source_cols = [source_identifier] if source_identifier else []
+    join1 = index.join(source, ancillary, source_cols, [class_col])
+    
+    #source polygon, area and area-class of every piece
+    sid = index.source_pos
+    n_source = len(index.source_area)
+    intersect_area = index.area
+    piece_class = join1[class_col]
+    
+    #sort thresholded classes once, most restrictive first; None and 0 get the remainder
     print("assigning thresholds to area classes")
-    for key, value in class_dict.items():
-        join1.loc[join1[class_col]== key, 'threshold']=value
-    
-    #start interpolation for designated columns; create new_cols for target dataframe
-    new_cols = []
-    for col in cols:
-        source_copy = col + 'copy'
-        if suffix:
-            new_col = col + suffix
-        else:
-            new_col = '_' + col
-        new_cols.append(new_col)
-        
-        #calculate areal weight
-        print("calculating areal weight")
-        join1['arealwt']=join1['intersect_area']/join1['source_area']
+    limited = sorted(((key, val) for key, val in class_dict.items() if val != None and val != 0),
+                     key = lambda item: item[1])
+    class_masks = [(piece_class == key).to_numpy() for key, val in limited]
+    remainder = piece_class.isin([key for key, val in class_dict.items() if val == None or val == 0]).to_numpy()
     
-        #copy column for interpolation (lambda in loop doesn't work first time without this)
-        join1[source_copy] = join1[col]
-        
-        #set new_col to 0 (lambda in loop doesn't work first time without this)
-        join1[new_col] = 0
-        
-        #create used area column - move area that will never be used
-        join1['used_area'] = join1.apply(lambda x: x['intersect_area'] if x[class_col] not in class_dict.keys() else 0, axis=1)
+    #area that will never be used - classes left out of the dictionary
+    unused = group_sum(sid, intersect_area * ~piece_class.isin(list(class_dict)).to_numpy(), n_source)
     
-        #create copy of class_dict for multiple columns, drop values of None
-        class_dict_copy = {key:val for key, val in class_dict.items() if val != None and val != 0}
-        
-        print("performing interpolation")
-        while class_dict_copy != {}:
-        
-            #interpolate
-            join1[new_col] = join1.apply(lambda x: x['arealwt']*x[source_copy] if x[class_col] == min(class_dict_copy, key = class_dict_copy.get) else x[new_col], axis=1)
-        
-            #if new column exceeds threshold, new column gets threshold density
-            join1[new_col] = join1[new_col].clip(upper = join1['threshold']*join1['intersect_area'])
-               
-            #add up successfully interpolated data and decrement
-            totals = join1.groupby('_index')[new_col].sum()
-            totals.rename('temp_sum', inplace=True)
-            join1 = join1.merge(totals, on='_index')
-            join1[source_copy] = join1[col] - join1['temp_sum']
-            
-            #copy used area for decrementing
-            join1['used_area'] = join1.apply(lambda x: x['intersect_area'] if x[class_col] == min(class_dict_copy, key = class_dict_copy.get) else x['used_area'], axis=1)
-            
-            #add up successfully interpolated areas and decrement 
-            totals2 = join1.groupby('_index')['used_area'].sum()
-            totals2.rename('temp_area_sum', inplace=True)
-            join1 = join1.merge(totals2, on ='_index')
-            join1['source_area_copy'] = join1['source_area'] - join1['temp_area_sum']
-            
-            #recalculate areal weight
-            join1['arealwt'] = join1['intersect_area']/join1['source_area_copy']
-            
-            #remove tempsum
-            del join1['temp_sum']
+    #new column names for target dataframe
+    if suffix:
+        new_cols = [col + suffix for col in cols]
+    else:
+        new_cols = ['_' + col for col in cols]
+    
+    #value and area left to distribute per source polygon, one column per
+    #designated field; the most restrictive class is weighted by the full source area
+    left = source[cols].fillna(0).to_numpy(dtype=float)
+    area_left = index.source_area
+    used_area = unused
+    values = np.zeros((len(index), len(cols)))
+    
+    print("performing interpolation")
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for (key, threshold), in_class in zip(limited, class_masks):
             
-            #remove temp_area_sum
-            del join1['temp_area_sum']
+            #interpolate all fields, if they exceed threshold they get threshold density
+            piece_sid = sid[in_class]
+            piece_area = intersect_area[in_class]
+            areal_wt = piece_area / area_left[piece_sid]
+            interpolated = np.minimum(areal_wt[:, None] * left[piece_sid],
+                                      threshold * piece_area[:, None])
+            interpolated[np.isnan(interpolated)] = 0
+            values[in_class] = interpolated
             
-            #remove minimum from dictionary
-            del class_dict_copy[min(class_dict_copy, key = class_dict_copy.get)]
-
-        #replace null values with 0 for classes with no restriction
-        join1.fillna(0, inplace=True)
+            #decrement successfully interpolated data and area
+            left = left - group_sum(piece_sid, interpolated, n_source)
+            used_area = used_area + group_sum(piece_sid, piece_area, n_source)
+            area_left = index.source_area - used_area
         
         #interpolate least restrictive
-        join1[new_col] = join1.apply(lambda x: x['arealwt']*x[source_copy] if x[class_col] in class_dict and x['threshold'] == 0 else x[new_col], axis=1)
+        piece_sid = sid[remainder]
+        areal_wt = intersect_area[remainder] / area_left[piece_sid]
+        interpolated = areal_wt[:, None] * left[piece_sid]
+        interpolated[np.isnan(interpolated)] = 0
+        values[remainder] = interpolated
+    join1[new_cols] = values
 
     #filter target dataframe
     if source_identifier:
@@ -376,7 +456,8 @@ def  lim_var(source, ancillary, class_col, class_dict, cols = [None], source_ide
         
     return target
 
-def n_class(source, ancillary, class_col, class_dict, cols = [None], source_identifier = '', suffix = ''):
+def n_class(source, ancillary, class_col, class_dict, cols = [None], source_identifier = '', suffix = '',
+            index = None, cache = None, tile_size = None, workers = None):
     """
     Interpolates values into disaggregated source polygons using n_class method with ancillary data.  
     Parameters
@@ -384,9 +465,12 @@ def n_class(source, ancillary, class_col, class_dict, cols = [None], source_iden
     source : DataFrame
         DataFrame with values for interpolation.
     ancillary : DataFrame
-        DataFrame with area-class map categories.
+        DataFrame with area-class map categories, or a land cover raster
+        whose pixel values are the categories. Class areas then come from
+        pixel counts under each source polygon.
     class_col : str
-        Area-class categories.
+        Area-class categories, or the name of the category column in the
+        result for a raster.
     class_dict : dict
         Area-class categories with assigned percentages.
     cols : list
@@ -395,47 +479,57 @@ def n_class(source, ancillary, class_col, class_dict, cols = [None], source_iden
         Column that identifies source polygons. The default is ''.
     suffix : str, optional
         New name for interpolated columns. The default is ''.
+    index : IntersectionIndex, optional
+        Precomputed intersection of source and ancillary. The default is None.
+    cache : str, optional
+        Parquet file for the intersection. It is reused when it was saved for
+        the same source and ancillary geometries, and written otherwise. The
+        default is None.
+    tile_size : float, optional
+        Build the intersection tile by tile on square tiles of this size to
+        bound memory. The default is None.
+    workers : int, optional
+        Build the intersection in this many processes. The default is None.
     Returns
     -------
     target : DataFrame
-        Target dataframe with interpolated columns.
+        Target dataframe with interpolated columns. For a raster there is
+        one row per source polygon and category, without geometry.
     """
-    #calculate source area
-    print("calculating source area")
-    source['source_area'] = source.geometry.area
-    
-    #reindex source for grouping sums later
-    source['_index'] = source.index
+    source_cols = [source_identifier] if source_identifier else []
+    if is_raster(ancillary):
+        #class areas from pixel counts under each source polygon
+        print("counting raster pixels")
+        source_pos, classes, area = class_areas(source, ancillary)
+        join1 = source[[*source_cols, *cols]].iloc[source_pos].reset_index(drop=True)
+        join1[class_col] = classes
+        source_area = group_sum(source_pos, area, len(source))[source_pos]
+        intersect_area = area
+    else:
+        #intersect source and ancillary data, or reuse the given intersection
+        index = intersection_index(index, source, ancillary, cache, tile_size=tile_size, workers=workers)
+        join1 = index.join(source, ancillary, [*source_cols, *cols], [class_col])
+        
+        #source polygon, source area and intersected area of every piece
+        source_pos = index.source_pos
+        source_area = index.source_area[source_pos]
+        intersect_area = index.area
     
     #assign percentages to landuse classes
     print("assigning percentages to classes")
-    for key, value in class_dict.items():
-        ancillary.loc[ancillary[class_col]== key, '_percent']=value
-    
-    #intersect source and ancillary data
-    print("overlaying shapefiles")
-    join1 = gpd.overlay(source, ancillary, how='intersection')
-    
-    #calculate intersected areas
-    print("calculating intersected area")
-    join1['intersect_area']=join1.geometry.area
+    percent = join1[class_col].map(class_dict).to_numpy(dtype=float)
     
     #calculate areal weight
     print("calculating areal weight")
-    join1['arealwt']=join1['intersect_area']/join1['source_area']
+    arealwt = intersect_area / source_area
     
     #multiply areal weight by user defined percentages
     print("modifying areal weight based on class percentages")
-    join1['class_weight']=join1['_percent'] * join1['arealwt']
+    class_weight = percent * arealwt
     
-    #sum of areal weight times percentage per source polygon
+    #fraction of the sum of areal weight times percentage per source polygon
     print("summing for source polygons")
-    totals = join1.groupby('_index')['class_weight'].sum()
-    totals.rename('temp_sum', inplace=True)
-    join1 = join1.merge(totals, on ='_index')
-    
-    #fraction for interpolation
-    join1['class_frac'] = join1['class_weight']/join1['temp_sum']
+    class_frac = group_share(source_pos, class_weight, len(source))
     
     #interpolate designated columns, create list to include in final dataframe
     print("interpolating designated fields")
@@ -443,12 +537,92 @@ def n_class(source, ancillary, class_col, class_dict, cols = [None], source_iden
     for col in cols:
         new_col = col + suffix
         new_cols.append(new_col)
-        join1[new_col] = join1['class_frac']*join1[col]
+        join1[new_col] = class_frac * join1[col]
     
     #filter target dataframe
+    geometry = ["geometry"] if "geometry" in join1 else []
     if source_identifier:
-        target = join1[[source_identifier, class_col, "geometry", *new_cols]]
+        target = join1[[source_identifier, class_col, *geometry, *new_cols]]
     else:
-        target = join1[[class_col, "geometry", *new_cols]]
+        target = join1[[class_col, *geometry, *new_cols]]
       
-    return target
\ No newline at end of file
+    return target
+
+def _binary_raster(source, ancillary, exclude_val, suffix, cols, aggregate, keep_geometry, source_cols):
+    if isinstance(aggregate, str) and aggregate != 'source':
+        raise ValueError("aggregate must be 'source' or a GeoDataFrame of zones")
+    zones = None if aggregate is None or isinstance(aggregate, str) else aggregate
+    new_cols = [col + suffix for col in cols]
+    
+    if zones is None:
+        #clip each source polygon to its kept pixels, like a dissolved mask,
+        #one masked polygon per source polygon keeps all of its values
+        print("masking raster pixels")
+        source_pos, geometry = masked_shapes(source, ancillary, exclude_val)
+        output = source.iloc[source_pos].reset_index(drop=True)
+        output[output.geometry.name] = geometry.values
+        if source_cols is not None:
+            output = output[[*_with_values(source_cols, cols), output.geometry.name]]
+        for col, new_col in zip(cols, new_cols):
+            output[new_col] = output[col]
+        output = _drop_values(output, source_cols, cols, new_cols)
+        if not keep_geometry:
+            output = pd.DataFrame(output.drop(columns=output.geometry.name))
+        return output
+    
+    #count kept pixels under each source and zone pair
+    print("counting raster pixels")
+    source_pos, zone_pos, area = masked_areas(source, ancillary, exclude_val, zones)
+    
+    #split each source polygon's values over zones by its share of kept pixels,
+    #counting kept pixels outside every zone in the source total
+    print("calculating areal weight")
+    total = group_sum(source_pos, area, len(source))
+    inside = zone_pos >= 0
+    weights = share_weights(source_pos[inside], zone_pos[inside], area[inside], len(source),
+                            len(zones), total)
+    results = apply_weights(weights, source, cols)
+    hit = has_weight(weights)
+    if keep_geometry:
+        output = zones[hit].reset_index(drop=True)
+        output[new_cols] = results[hit]
+    else:
+        output = pd.DataFrame(results[hit], columns=new_cols, index=zones.index[hit])
+    return output
+
+def _aggregate_pieces(pieces, division, new_cols, aggregate, keep_geometry):
+    #sum masked pieces per source polygon
+    if isinstance(aggregate, str):
+        if aggregate != 'source':
+            raise ValueError("aggregate must be 'source' or a GeoDataFrame of zones")
+        print("aggregating to source polygons")
+        first = group_first(division)
+        groups = np.unique(division, return_inverse=True)[1]
+        output = pieces.iloc[first].reset_index(drop=True)
+        output[new_cols] = group_sum(groups, pieces[new_cols].to_numpy(dtype=float), len(first))
+        if keep_geometry:
+            output[output.geometry.name] = group_union(groups, np.asarray(pieces.geometry.values))
+            return output
+        return pd.DataFrame(output.drop(columns=output.geometry.name))
+    
+    #or interpolate them into the given zones by areal weight
+    print("aggregating to zones")
+    return arealwt(pieces, aggregate, new_cols, attributes_only=not keep_geometry)
+
+def _with_values(source_cols, cols):
+    #carried over columns plus the columns to interpolate, None keeps every column
+    if source_cols is None:
+        return None
+    return list(dict.fromkeys([*source_cols, *cols]))
+
+def _drop_values(output, source_cols, cols, new_cols):
+    #drop the columns to interpolate that were only needed for their values
+    if source_cols is None:
+        return output
+    return output.drop(columns=[col for col in cols if col not in source_cols and col not in new_cols])
+
+def _parcel_units(parcel, tu_col, ru_col, ba_col, ra_col):
+    #residential units and adjusted residential area of every parcel
+    M = ((parcel[ra_col] == 0) & (parcel[ru_col] != 0)).astype(int)
+    ara = (M *((parcel[ba_col] * parcel[ru_col]) / parcel[tu_col])) + parcel[ra_col]
+    return parcel[ru_col].to_numpy(dtype=float), ara.to_numpy(dtype=float)
@@ -0,0 +1,83 @@
+import numpy as np
+from scipy import sparse
+
+from modules.aggregate import group_sum
+
+
+def areal_weights(index):
+    """
+    Builds the target by source matrix of areal weights from an intersection.
+    Entry (t, s) is the share of source polygon s that falls in target
+    polygon t, so the matrix times a column of source values gives the
+    interpolated target values.
+    Parameters
+    ----------
+    index : IntersectionIndex
+        Intersection of source and target.
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Areal weights with one row per target and one column per source.
+    """
+    areal_wt = index.area / index.source_area[index.source_pos]
+    shape = (len(index.target_area), len(index.source_area))
+    return sparse.csr_matrix((areal_wt, (index.target_pos, index.source_pos)), shape=shape)
+
+
+def apply_weights(weights, source, cols):
+    """
+    Interpolates source columns with a weight matrix in a single sparse
+    product.
+    Parameters
+    ----------
+    weights : scipy.sparse matrix
+        Weights with one row per target and one column per source.
+    source : DataFrame
+        Dataframe with values for interpolation.
+    cols : list
+        Column(s) from source to be interpolated.
+    Returns
+    -------
+    values : ndarray
+        Interpolated values with one row per target and one column per col.
+    """
+    values = source[list(cols)].fillna(0).to_numpy(dtype=float)
+    return np.asarray(weights @ values)
+
+
+def has_weight(weights):
+    """
+    Returns a boolean mask of the rows of weights with at least one entry.
+    """
+    return np.diff(weights.tocsr().indptr) > 0
+
+
+def share_weights(source_pos, target_pos, area, n_source, n_target, total = None):
+    """
+    Builds target by source weights from the area each source polygon shares
+    with each target polygon, divided by the total area of the source polygon,
+    by default its total shared area so its weights sum to one.
+    Parameters
+    ----------
+    source_pos : ndarray
+        Source position of each pair.
+    target_pos : ndarray
+        Target position of each pair.
+    area : ndarray
+        Shared area of each pair.
+    n_source : int
+        Number of source polygons.
+    n_target : int
+        Number of target polygons.
+    total : ndarray, optional
+        Total area of every source polygon to divide by. The default is None,
+        which uses the sum of its shared areas.
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Weights with one row per target and one column per source.
+    """
+    if total is None:
+        total = group_sum(source_pos, area, n_source)
+    share = area / total[source_pos]
+    return sparse.csr_matrix((share, (target_pos, source_pos)), shape=(n_target, n_source))
@@ -15,11 +15,35 @@ from PyQt5 import QtGui
 
 # interpolation imports
 from modules.sp_interpolate import arealwt, binary_vector, parcel_method, expert_system, lim_var, n_class
+from modules.layer_io import TABLE_EXTENSIONS, extent, read_layer, write_layer
 
 # Functional imports
 import geopandas as gpd
+import os
 import sys
 
+# ancillary files with these extensions are passed to the methods as rasters
+RASTER_EXTENSIONS = ('.tif', '.tiff', '.img', '.vrt')
+
+def read_inputs(paths, columns):
+    # read the smallest input file first and the others only within its extent,
+    # so features that cannot intersect it are never read; returns the layers in
+    # the order of paths and the position of a layer that failed to read, or None
+    layers = [None] * len(paths)
+    bbox = None
+    for i in sorted(range(len(paths)), key=lambda i: file_size(paths[i])):
+        try:
+            layers[i] = read_layer(paths[i], columns[i], bbox)
+        except:
+            return layers, i
+        if bbox is None and len(layers[i]):
+            bbox = extent(layers[i])
+    return layers, None
+
+def file_size(path):
+    # size on disk, folders such as geodatabases are treated as the largest
+    return os.path.getsize(path) if os.path.isfile(path) else float('inf')
+
 #############################################################################################
 class projectWidget(qtw.QMainWindow):
     
@@ -66,28 +90,22 @@ class aw_Worker(qtc.QObject):
     @qtc.pyqtSlot(str,str,list,str,str) # decorator to allow arguments
     def worker_func(self, src, target, intp, suffix, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing target shapefile")
-            target = gpd.read_file(target)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source and target shapefiles")
+        (src, target), failed = read_inputs([src, target], [intp, None])
+        if failed is not None:
+            (self.src_error, self.target_error)[failed].emit()
             return
+        count += 20
+        self.countChanged.emit(count)
         try:
-            outp = arealwt(src, target, intp, suffix)
+            # csv output gets the attribute table only, without target geometry
+            attributes_only = save.lower().endswith('.csv')
+            id_cols = [col for col in target.columns if col != target.geometry.name]
+            outp = arealwt(src, target, intp, suffix, attributes_only=attributes_only, target_id=id_cols)
             count += 75
             self.countChanged.emit(count)
             print("saving results")
-            outp.to_file(save)
+            write_layer(outp, save)
             count += 5
             self.countChanged.emit(count)
             self.finished.emit()
@@ -186,29 +204,23 @@ class bm_Worker(qtc.QObject):
     @qtc.pyqtSlot(str,str,str,list,str,list,str) # decorator to allow arguments
     def worker_func(self, src, target, exclude, exclude_val, suffix, intp, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing ancillary shapefile")
-            target = gpd.read_file(target)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source and ancillary shapefiles")
+        if target.lower().endswith(RASTER_EXTENSIONS):
+            (src,), failed = read_inputs([src], [None])
+        else:
+            (src, target), failed = read_inputs([src, target], [None, [exclude]])
+        if failed is not None:
+            (self.src_error, self.target_error)[failed].emit()
             return
+        count += 20
+        self.countChanged.emit(count)
         try:
             if any(char.isalpha() for string in exclude_val for char in string): 
                 outp = binary_vector(src, target, exclude, exclude_val, suffix, intp)
                 count += 75
                 self.countChanged.emit(count)
                 print("saving results")
-                outp.to_file(save)
+                write_layer(outp, save)
                 count += 5
                 self.countChanged.emit(count)
                 self.finished.emit()  
@@ -218,7 +230,7 @@ class bm_Worker(qtc.QObject):
                 count += 75
                 self.countChanged.emit(count)
                 print("saving results")
-                outp.to_file(save)
+                write_layer(outp, save)
                 count += 5
                 self.countChanged.emit(count)
                 self.finished.emit()
@@ -319,22 +331,14 @@ class lv_Worker(qtc.QObject):
     @qtc.pyqtSlot(str,str,str,str,list,str,str,str) # decorator to allow arguments
     def worker_func(self, src, target, cls, clsdict, intp, srcid, suffix, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing ancillary shapefile")
-            target = gpd.read_file(target)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source and ancillary shapefiles")
+        src_cols = [*intp, srcid] if srcid else intp
+        (src, target), failed = read_inputs([src, target], [src_cols, [cls]])
+        if failed is not None:
+            (self.src_error, self.target_error)[failed].emit()
             return
+        count += 20
+        self.countChanged.emit(count)
         try:
             print("converting inputs to dictionary")
             # read keypairs into dict splitting the strings on commas and colons
@@ -357,7 +361,7 @@ class lv_Worker(qtc.QObject):
             count += 55
             self.countChanged.emit(count)
             print("saving results")
-            outp.to_file(save)
+            write_layer(outp, save)
             count += 5
             self.countChanged.emit(count)
             self.finished.emit()
@@ -455,26 +459,22 @@ class nc_Worker(qtc.QObject):
     src_error = qtc.pyqtSignal() # source shapefile error
     target_error = qtc.pyqtSignal() # target shapefile error
     countChanged = qtc.pyqtSignal(int) # update progbar signal
+    saved_as = qtc.pyqtSignal(str) # output renamed to a table file
     
     @qtc.pyqtSlot(str,str,str,str,list,str,str,str) # decorator to allow arguments
     def worker_func(self, src, target, cls, clsdict, intp, srcid, suffix, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing ancillary shapefile")
-            target = gpd.read_file(target)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source and ancillary shapefiles")
+        src_cols = [*intp, srcid] if srcid else intp
+        if target.lower().endswith(RASTER_EXTENSIONS):
+            (src,), failed = read_inputs([src], [src_cols])
+        else:
+            (src, target), failed = read_inputs([src, target], [src_cols, [cls]])
+        if failed is not None:
+            (self.src_error, self.target_error)[failed].emit()
             return
+        count += 20
+        self.countChanged.emit(count)
         try:
             print("converting inputs to dictionary")
             # read keypairs into dict splitting the strings on commas and colons
@@ -497,7 +497,12 @@ class nc_Worker(qtc.QObject):
             count += 55
             self.countChanged.emit(count)
             print("saving results")
-            outp.to_file(save)
+            if not isinstance(outp, gpd.GeoDataFrame) and not save.lower().endswith(TABLE_EXTENSIONS):
+                # a raster ancillary gives a table without geometry, saved as csv
+                save = os.path.splitext(save)[0] + '.csv'
+                print("no geometry to save, writing the table to " + save)
+                self.saved_as.emit(save)
+            write_layer(outp, save)
             count += 5
             self.countChanged.emit(count)
             self.finished.emit()                    
@@ -554,6 +559,7 @@ class nc(qtw.QWidget):
             self.worker.src_error.connect(self.thread.quit) # quit thread on shapefile error
             self.worker.target_error.connect(self.src_fail) # error popup on shapefile error
             self.worker.target_error.connect(self.thread.quit) # quit thread on shapefile error
+            self.worker.saved_as.connect(self.table_saved) # popup with the table file name
             self.worker.countChanged.connect(self.onCountChanged) # connect count change signal to progressbar       
             # start thread
             self.thread.start()        
@@ -585,6 +591,8 @@ class nc(qtw.QWidget):
             qtw.QMessageBox.critical(self, 'Error', 'Target Shapefile is invalid')
         def success(self):
             qtw.QMessageBox.information(self, 'Success', 'Interpolation Complete')
+        def table_saved(self, save):
+            qtw.QMessageBox.information(self, 'Saved as table', 'A raster ancillary gives a table without geometry, saved to ' + save)
         def close_nc(self):
             self.close()
 
@@ -596,31 +604,24 @@ class pm_Worker(qtc.QObject):
     target_error = qtc.pyqtSignal() # target shapefile error
     countChanged = qtc.pyqtSignal(int) # update progbar signal
     
-    @qtc.pyqtSlot(str,str,str,str,str,str,list,str) # decorator to allow arguments
-    def worker_func(self, src, target, tu, ru, ba, ra, intp, save):
+    @qtc.pyqtSlot(str,str,str,str,str,str,list,list,str) # decorator to allow arguments
+    def worker_func(self, src, target, tu, ru, ba, ra, intp, pid, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing parcel shapefile")
-            target = gpd.read_file(target)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source and parcel shapefiles")
+        # parcels are read whole unless ID fields are named to keep
+        parcel_cols = [*pid, tu, ru, ba, ra] if pid else None
+        (src, target), failed = read_inputs([src, target], [None, parcel_cols])
+        if failed is not None:
+            (self.src_error, self.target_error)[failed].emit()
             return
+        count += 20
+        self.countChanged.emit(count)
         try:
             outp = parcel_method(src, target, tu, ru, ba, ra, intp)
             count += 75
             self.countChanged.emit(count)
             print("saving results")
-            outp.to_file(save)
+            write_layer(outp, save)
             count += 5
             self.countChanged.emit(count)
             self.finished.emit()
@@ -629,7 +630,7 @@ class pm_Worker(qtc.QObject):
             return
         
 class pm(qtw.QWidget):
-        worker_requested = qtc.pyqtSignal(str,str,str,str,str,str,list,str)     
+        worker_requested = qtc.pyqtSignal(str,str,str,str,str,str,list,list,str)     
         def __init__(self):
             super().__init__()
             self.ui = Ui_Parcel_Method()
@@ -659,6 +660,7 @@ class pm(qtw.QWidget):
             ra = self.ui.parcel_ra.text()            
             intp = self.ui.parcel_intp.text()
             intp = intp.split()
+            pid = self.ui.parcel_id.text().split()
             save = self.ui.parcel_save_lineedit.text()        
             # create thread
             self.thread = qtc.QThread()
@@ -680,7 +682,7 @@ class pm(qtw.QWidget):
             # start thread
             self.thread.start()        
             # send data to worker
-            self.worker_requested.emit(src,target,tu,ru,ba,ra,intp,save)        
+            self.worker_requested.emit(src,target,tu,ru,ba,ra,intp,pid,save)        
             # enable or disable button based on events
             self.ui.parcel_run_prog.setEnabled(False)
             self.thread.finished.connect(
@@ -719,39 +721,29 @@ class em_Worker(qtc.QObject):
     nest_error = qtc.pyqtSignal() # nested shapefile error
     countChanged = qtc.pyqtSignal(int) # update progbar signal
     
-    @qtc.pyqtSlot(str, str, str, str, str, str, str, str, str) # decorator to allow arguments
-    def worker_func(self, src, nest, parcel, tu, ru, ba, ra, intp, save):
+    @qtc.pyqtSlot(str, str, str, str, str, str, str, str, list, str) # decorator to allow arguments
+    def worker_func(self, src, nest, parcel, tu, ru, ba, ra, intp, pid, save):
         count = 0
-        try:
-            print("analyzing source shapefile")
-            src = gpd.read_file(src)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.src_error.emit()
-            return
-        try:
-            print("analyzing nested shapefile")
-            nest = gpd.read_file(nest)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
+        print("analyzing source, nested and parcel shapefiles")
+        # parcels are read whole unless ID fields are named to keep
+        parcel_cols = [*pid, tu, ru, ba, ra] if pid else None
+        (src, nest, parcel), failed = read_inputs([src, nest, parcel],
+                                                  [intp.split(), None, parcel_cols])
+        if failed is not None:
+            (self.src_error, self.target_error, self.target_error)[failed].emit()
             return
+        count += 30
+        self.countChanged.emit(count)   
         try:
-            print("analyzing parcel shapefile")
-            parcel = gpd.read_file(parcel)
-            count += 10
-            self.countChanged.emit(count)
-        except:
-            self.target_error.emit()
-            return   
-        try:
+            # several fields separated by spaces are interpolated in one run
+            intp = intp.split()
+            if len(intp) == 1:
+                intp = intp[0]
             outp = expert_system(src, nest, parcel, tu, ru, ba, ra, intp)
             count += 65
             self.countChanged.emit(count)
             print("saving results")
-            outp.to_file(save)
+            write_layer(outp, save)
             count += 5
             self.countChanged.emit(count)
             self.finished.emit()                        
@@ -760,7 +752,7 @@ class em_Worker(qtc.QObject):
             return
             
 class em(qtw.QWidget): 
-        worker_requested = qtc.pyqtSignal(str, str, str, str, str, str, str, str, str) 
+        worker_requested = qtc.pyqtSignal(str, str, str, str, str, str, str, str, list, str) 
         def __init__(self):
             super().__init__()
             self.ui = Ui_Expert_Method()
@@ -794,6 +786,7 @@ class em(qtw.QWidget):
             ba = self.ui.expert_ba.text()
             ra = self.ui.expert_ra.text()            
             intp = self.ui.expert_intp.text()
+            pid = self.ui.expert_id.text().split()
             save = self.ui.expert_save_lineedit.text()        
             # create thread
             self.thread = qtc.QThread()
@@ -817,7 +810,7 @@ class em(qtw.QWidget):
             # start thread
             self.thread.start()        
             # send data to worker
-            self.worker_requested.emit(src, nest, parcel, tu, ru, ba, ra, intp, save)        
+            self.worker_requested.emit(src, nest, parcel, tu, ru, ba, ra, intp, pid, save)        
             # enable or disable button based on events
             self.ui.expert_run_prog.setEnabled(False)
             self.thread.finished.connect(
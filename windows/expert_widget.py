@@ -17,12 +17,12 @@ class Ui_Expert_Method(object):
         self.label.setTextInteractionFlags(QtCore.Qt.TextBrowserInteraction)
         self.label.setObjectName("label")
         self.frame = QtWidgets.QFrame(Expert_Method)
-        self.frame.setGeometry(QtCore.QRect(10, 30, 511, 381))
+        self.frame.setGeometry(QtCore.QRect(10, 30, 511, 421))
         self.frame.setFrameShape(QtWidgets.QFrame.Box)
         self.frame.setFrameShadow(QtWidgets.QFrame.Raised)
         self.frame.setObjectName("frame")
         self.horizontalLayoutWidget_5 = QtWidgets.QWidget(self.frame)
-        self.horizontalLayoutWidget_5.setGeometry(QtCore.QRect(10, 330, 491, 41))
+        self.horizontalLayoutWidget_5.setGeometry(QtCore.QRect(10, 370, 491, 41))
         self.horizontalLayoutWidget_5.setObjectName("horizontalLayoutWidget_5")
         self.horizontalLayout_6 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_5)
         self.horizontalLayout_6.setContentsMargins(0, 0, 0, 0)
@@ -72,6 +72,18 @@ class Ui_Expert_Method(object):
         self.expert_intp = QtWidgets.QLineEdit(self.horizontalLayoutWidget_9)
         self.expert_intp.setObjectName("expert_intp")
         self.horizontalLayout_10.addWidget(self.expert_intp)
+        self.horizontalLayoutWidget_11 = QtWidgets.QWidget(self.frame)
+        self.horizontalLayoutWidget_11.setGeometry(QtCore.QRect(10, 330, 491, 41))
+        self.horizontalLayoutWidget_11.setObjectName("horizontalLayoutWidget_11")
+        self.horizontalLayout_11 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_11)
+        self.horizontalLayout_11.setContentsMargins(0, 0, 0, 0)
+        self.horizontalLayout_11.setObjectName("horizontalLayout_11")
+        self.label_11 = QtWidgets.QLabel(self.horizontalLayoutWidget_11)
+        self.label_11.setObjectName("label_11")
+        self.horizontalLayout_11.addWidget(self.label_11)
+        self.expert_id = QtWidgets.QLineEdit(self.horizontalLayoutWidget_11)
+        self.expert_id.setObjectName("expert_id")
+        self.horizontalLayout_11.addWidget(self.expert_id)
         self.horizontalLayoutWidget_4 = QtWidgets.QWidget(self.frame)
         self.horizontalLayoutWidget_4.setGeometry(QtCore.QRect(10, 170, 491, 41))
         self.horizontalLayoutWidget_4.setObjectName("horizontalLayoutWidget_4")
@@ -146,7 +158,7 @@ class Ui_Expert_Method(object):
         self.expert_source_browse.setObjectName("expert_source_browse")
         self.horizontalLayout.addWidget(self.expert_source_browse)
         self.horizontalLayoutWidget_6 = QtWidgets.QWidget(Expert_Method)
-        self.horizontalLayoutWidget_6.setGeometry(QtCore.QRect(10, 410, 511, 41))
+        self.horizontalLayoutWidget_6.setGeometry(QtCore.QRect(10, 450, 511, 41))
         self.horizontalLayoutWidget_6.setObjectName("horizontalLayoutWidget_6")
         self.horizontalLayout_7 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_6)
         self.horizontalLayout_7.setContentsMargins(0, 0, 0, 0)
@@ -179,7 +191,8 @@ class Ui_Expert_Method(object):
         Expert_Method.setTabOrder(self.expert_ru, self.expert_ba)
         Expert_Method.setTabOrder(self.expert_ba, self.expert_ra)
         Expert_Method.setTabOrder(self.expert_ra, self.expert_intp)
-        Expert_Method.setTabOrder(self.expert_intp, self.expert_save_lineedit)
+        Expert_Method.setTabOrder(self.expert_intp, self.expert_id)
+        Expert_Method.setTabOrder(self.expert_id, self.expert_save_lineedit)
         Expert_Method.setTabOrder(self.expert_save_lineedit, self.expert_save_browse)
         Expert_Method.setTabOrder(self.expert_save_browse, self.expert_run_prog)
         Expert_Method.setTabOrder(self.expert_run_prog, self.expert_cancel_prog)
@@ -195,8 +208,10 @@ class Ui_Expert_Method(object):
         self.expert_ra.setPlaceholderText(_translate("Expert_Method", "Name of the field containing the residential area per parcel"))
         self.label_9.setText(_translate("Expert_Method", "Building Area Field"))
         self.expert_ba.setPlaceholderText(_translate("Expert_Method", "Name of the field containing the building area per parcel"))
-        self.label_10.setText(_translate("Expert_Method", "Interpolation Field"))
-        self.expert_intp.setPlaceholderText(_translate("Expert_Method", "Name of the field to interpolate, just one"))
+        self.label_10.setText(_translate("Expert_Method", "Interpolation Fields"))
+        self.expert_intp.setPlaceholderText(_translate("Expert_Method", "Name(s) of the field(s) to interpolate, space separated"))
+        self.label_11.setText(_translate("Expert_Method", "Parcel ID Fields"))
+        self.expert_id.setPlaceholderText(_translate("Expert_Method", "Optional: parcel ID field(s) to keep, space separated; empty keeps every field"))
         self.label_6.setText(_translate("Expert_Method", "Residential Units Field"))
         self.expert_ru.setPlaceholderText(_translate("Expert_Method", "Name of the field containing the number of residential units per parcel"))
         self.label_4.setText(_translate("Expert_Method", "Total Units Field:"))
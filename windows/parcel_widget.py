@@ -75,12 +75,12 @@ class Ui_Parcel_Method(object):
         self.parcel_ru.setObjectName("parcel_ru")
         self.horizontalLayout_5.addWidget(self.parcel_ru)
         self.frame = QtWidgets.QFrame(Parcel_Method)
-        self.frame.setGeometry(QtCore.QRect(10, 30, 511, 341))
+        self.frame.setGeometry(QtCore.QRect(10, 30, 511, 381))
         self.frame.setFrameShape(QtWidgets.QFrame.Box)
         self.frame.setFrameShadow(QtWidgets.QFrame.Raised)
         self.frame.setObjectName("frame")
         self.horizontalLayoutWidget_5 = QtWidgets.QWidget(self.frame)
-        self.horizontalLayoutWidget_5.setGeometry(QtCore.QRect(10, 290, 491, 41))
+        self.horizontalLayoutWidget_5.setGeometry(QtCore.QRect(10, 330, 491, 41))
         self.horizontalLayoutWidget_5.setObjectName("horizontalLayoutWidget_5")
         self.horizontalLayout_6 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_5)
         self.horizontalLayout_6.setContentsMargins(0, 0, 0, 0)
@@ -130,8 +130,20 @@ class Ui_Parcel_Method(object):
         self.parcel_intp = QtWidgets.QLineEdit(self.horizontalLayoutWidget_9)
         self.parcel_intp.setObjectName("parcel_intp")
         self.horizontalLayout_10.addWidget(self.parcel_intp)
+        self.horizontalLayoutWidget_10 = QtWidgets.QWidget(self.frame)
+        self.horizontalLayoutWidget_10.setGeometry(QtCore.QRect(10, 290, 491, 41))
+        self.horizontalLayoutWidget_10.setObjectName("horizontalLayoutWidget_10")
+        self.horizontalLayout_11 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_10)
+        self.horizontalLayout_11.setContentsMargins(0, 0, 0, 0)
+        self.horizontalLayout_11.setObjectName("horizontalLayout_11")
+        self.label_11 = QtWidgets.QLabel(self.horizontalLayoutWidget_10)
+        self.label_11.setObjectName("label_11")
+        self.horizontalLayout_11.addWidget(self.label_11)
+        self.parcel_id = QtWidgets.QLineEdit(self.horizontalLayoutWidget_10)
+        self.parcel_id.setObjectName("parcel_id")
+        self.horizontalLayout_11.addWidget(self.parcel_id)
         self.horizontalLayoutWidget_6 = QtWidgets.QWidget(Parcel_Method)
-        self.horizontalLayoutWidget_6.setGeometry(QtCore.QRect(10, 370, 511, 41))
+        self.horizontalLayoutWidget_6.setGeometry(QtCore.QRect(10, 410, 511, 41))
         self.horizontalLayoutWidget_6.setObjectName("horizontalLayoutWidget_6")
         self.horizontalLayout_7 = QtWidgets.QHBoxLayout(self.horizontalLayoutWidget_6)
         self.horizontalLayout_7.setContentsMargins(0, 0, 0, 0)
@@ -166,7 +178,8 @@ class Ui_Parcel_Method(object):
         Parcel_Method.setTabOrder(self.parcel_ru, self.parcel_ba)
         Parcel_Method.setTabOrder(self.parcel_ba, self.parcel_ra)
         Parcel_Method.setTabOrder(self.parcel_ra, self.parcel_intp)
-        Parcel_Method.setTabOrder(self.parcel_intp, self.parcel_save_lineedit)
+        Parcel_Method.setTabOrder(self.parcel_intp, self.parcel_id)
+        Parcel_Method.setTabOrder(self.parcel_id, self.parcel_save_lineedit)
         Parcel_Method.setTabOrder(self.parcel_save_lineedit, self.parcel_save_browse)
         Parcel_Method.setTabOrder(self.parcel_save_browse, self.parcel_run_prog)
         Parcel_Method.setTabOrder(self.parcel_run_prog, self.parcel_cancel_prog)
@@ -194,6 +207,8 @@ class Ui_Parcel_Method(object):
         self.parcel_ba.setPlaceholderText(_translate("Parcel_Method", "Name of the field containing the building area per parcel"))
         self.label_10.setText(_translate("Parcel_Method", "Interpolation Fields"))
         self.parcel_intp.setPlaceholderText(_translate("Parcel_Method", "Name(s) of the field(s) to interpolate, space separated"))
+        self.label_11.setText(_translate("Parcel_Method", "Parcel ID Fields"))
+        self.parcel_id.setPlaceholderText(_translate("Parcel_Method", "Optional: parcel ID field(s) to keep, space separated; empty keeps every field"))
         self.parcel_run_prog.setText(_translate("Parcel_Method", "Run"))
         self.parcel_cancel_prog.setText(_translate("Parcel_Method", "Cancel"))
 